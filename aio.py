@@ -0,0 +1,112 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+
+from flask import g, has_app_context
+
+from sqlalchemy.engine import make_url
+
+from models import engine_options, statement_timeout_args
+
+try:
+    from sqlalchemy.ext.asyncio import create_async_engine
+except ImportError:
+    create_async_engine = None
+
+#----------------------------------------------------------------------------#
+# Concurrent queries.
+#----------------------------------------------------------------------------#
+
+# Async drivers for each dialect of SQLALCHEMY_DATABASE_URI.
+ASYNC_DRIVERS = {
+    'postgresql': 'asyncpg',
+    'sqlite': 'aiosqlite',
+}
+
+
+def async_url(url):
+    """SQLALCHEMY_DATABASE_URI with its driver swapped for the async one."""
+    url = make_url(url)
+    return url.set(drivername='%s+%s' % (url.get_backend_name(), ASYNC_DRIVERS[url.get_backend_name()]))
+
+
+class AsyncQueries:
+    """Runs independent SELECTs of one request concurrently.
+
+    Each process gets one event loop, in a daemon thread, with SQLAlchemy's
+    asyncio engine on it. Views stay synchronous: fetch_all() hands the
+    statements to the loop, which runs each on its own pooled connection,
+    and waits for all of them. Keeping a single loop (rather than Flask async
+    views, which start a new loop per request) lets asyncpg connections and
+    their prepared statement caches be reused across requests.
+
+    The statements don't share a transaction, so they may see different
+    snapshots; use it for reads that tolerate that, such as page data.
+    """
+
+    def __init__(self, app=None):
+        self.engine = None
+        self._loop = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ASYNC_QUERIES', False)
+        app.config.setdefault('ASYNC_DATABASE_URI', None)
+        if not app.config['ASYNC_QUERIES']:
+            return
+        if create_async_engine is None:
+            raise RuntimeError('ASYNC_QUERIES needs SQLAlchemy 1.4 with asyncio support (pip install "sqlalchemy[asyncio]")')
+        self.app = app
+        app.extensions['aio'] = self
+
+    def _start(self):
+        """The loop and engine of this process, started on first use (so a
+        forking server starts them in each worker)."""
+        with self._lock:
+            if self._pid != os.getpid():
+                config = self.app.config
+                url = make_url(config['ASYNC_DATABASE_URI'] or async_url(config['SQLALCHEMY_DATABASE_URI']))
+                options = engine_options(config, url.get_backend_name())
+                if url.get_backend_name() == 'postgresql':
+                    options['connect_args'] = statement_timeout_args(config, url.get_driver_name())
+                self.engine = create_async_engine(url, **options)
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='fyyur-aio', daemon=True).start()
+                self._pid = os.getpid()
+        return self._loop
+
+    def run(self, coroutine, timeout=None):
+        """Run ``coroutine`` on the loop and wait for its result. It runs in
+        an empty context rather than a copy of the caller's, so it never
+        sees (or changes) the request's app context and g."""
+        loop = self._start()
+        return contextvars.Context().run(asyncio.run_coroutine_threadsafe, coroutine, loop).result(timeout)
+
+    def fetch_all(self, *statements):
+        """Rows of each statement, in order, fetched concurrently."""
+        results = self.run(self._gather(statements))
+        # The loop has no app context (see run()), so instrumentation.py
+        # can't count these statements as they run: add them to the request.
+        if has_app_context():
+            g.statements = g.get('statements', 0) + sum(count for _, count, _ in results)
+            g.db_time = g.get('db_time', 0.0) + sum(elapsed for _, _, elapsed in results)
+        return [rows for rows, _, _ in results]
+
+    async def _gather(self, statements):
+        return await asyncio.gather(*(self._fetch(statement) for statement in statements))
+
+    async def _fetch(self, statement):
+        """(rows, statements executed, seconds spent executing them)."""
+        async with self.engine.connect() as connection:
+            start = time.perf_counter()
+            result = await connection.execute(statement)
+            rows = result.all()
+            return rows, 1, time.perf_counter() - start
+
+
+aio = AsyncQueries()
@@ -0,0 +1,244 @@
+import json
+from datetime import date, datetime, timedelta
+
+from flask import Blueprint, current_app, request
+from sqlalchemy import select
+
+from models import Venue, Artist
+import bookings
+import facets
+import geo
+import queries
+import search
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+#----------------------------------------------------------------------------#
+# Serialization.
+#----------------------------------------------------------------------------#
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError('%r is not JSON serializable' % (value,))
+
+
+def dumps(value):
+    """JSON bytes, with orjson (in requirements.txt), or the standard
+    library encoder where it is not installed."""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, default=_default, separators=(',', ':')).encode()
+
+
+def json_response(value, status=200):
+    return current_app.response_class(dumps(value), status=status, mimetype='application/json')
+
+
+class APIError(Exception):
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@api.errorhandler(APIError)
+def api_error(error):
+    return json_response({'error': error.message}, error.status)
+
+#----------------------------------------------------------------------------#
+# Fields and paging.
+#----------------------------------------------------------------------------#
+
+ENTITY_FIELDS = ['id', 'name', 'genres', 'city', 'state', 'phone', 'website',
+                 'facebook_link', 'image_link', 'seeking_description']
+
+VENUE_FIELDS = {name: getattr(Venue, name) for name in ENTITY_FIELDS + ['address', 'seeking_talent']}
+ARTIST_FIELDS = {name: getattr(Artist, name) for name in ENTITY_FIELDS + ['seeking_venue']}
+SEARCH_FIELDS = ['id', 'name', 'num_upcoming_shows']
+
+# Longest window a free slots request may cover
+MAX_SLOT_WINDOW = timedelta(days=366)
+
+
+def requested_fields(available, default):
+    """Names from ?fields=a,b (or ``default``), rejecting unknown ones."""
+    value = request.args.get('fields')
+    if not value:
+        return list(default)
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise APIError('unknown fields: %s' % ', '.join(unknown))
+    return names
+
+
+def requested_limit():
+    maximum = current_app.config['API_MAX_PAGE_SIZE']
+    try:
+        limit = int(request.args.get('limit', current_app.config['API_PAGE_SIZE']))
+    except ValueError:
+        raise APIError('limit must be an integer')
+    if not 0 < limit <= maximum:
+        raise APIError('limit must be between 1 and %d' % maximum)
+    return limit
+
+
+def project(rows, names):
+    return [{name: getattr(row, name) for name in names} for row in rows]
+
+#----------------------------------------------------------------------------#
+# Endpoints.
+#----------------------------------------------------------------------------#
+
+def list_entities(model, available):
+    names = requested_fields(available, ['id', 'name'])
+    after = request.args.get('after')
+    if after is not None:
+        try:
+            after = int(after)
+        except ValueError:
+            raise APIError('invalid cursor')
+    rows, next_after = queries.entity_page(model, [available[name] for name in names],
+                                           after=after, limit=requested_limit())
+    return json_response({'data': project(rows, names), 'next': next_after})
+
+
+def entity_detail(model, available, id, shows_statement, partner_fields):
+    names = requested_fields(list(available) + ['past_shows', 'upcoming_shows'],
+                             list(available) + ['past_shows', 'upcoming_shows'])
+    columns = [available[name] for name in names if name in available]
+    statements = [select(model.id, *columns).where(model.id == id)]
+    with_shows = 'past_shows' in names or 'upcoming_shows' in names
+    if with_shows:
+        statements.append(shows_statement(id))
+    results = queries.fetch_all(*statements)
+    if not results[0]:
+        raise APIError('not found', 404)
+    row = results[0][0]
+    data = {name: getattr(row, name) for name in names if name in available}
+
+    if with_shows:
+        past_shows, upcoming_shows = queries.partition_shows(results[1])
+        shows = {'past_shows': past_shows, 'upcoming_shows': upcoming_shows}
+        for name in ('past_shows', 'upcoming_shows'):
+            if name in names:
+                data[name] = project(shows[name], partner_fields)
+    return json_response(data)
+
+
+def requested_time(name, default):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise APIError('%s must be an ISO 8601 date and time' % name)
+
+
+def entity_free_slots(field, id):
+    start = requested_time('start', queries.request_now().replace(second=0, microsecond=0))
+    end = requested_time('end', start + timedelta(days=7))
+    if not start < end <= start + MAX_SLOT_WINDOW:
+        raise APIError('end must be after start and at most %d days later' % MAX_SLOT_WINDOW.days)
+    try:
+        min_minutes = int(request.args.get('min_minutes', 1))
+    except ValueError:
+        raise APIError('min_minutes must be an integer')
+    slots = bookings.free_slots(field, id, start, end, timedelta(minutes=min_minutes))
+    if slots is None:
+        raise APIError('not found', 404)
+    return json_response({'data': [{'start_time': slot_start, 'end_time': slot_end}
+                                   for slot_start, slot_end in slots]})
+
+
+def browse_entities(model):
+    filters = facets.requested_filters(model, request.args)
+    return json_response(facets.browse(model, filters, limit=requested_limit()))
+
+
+def search_entities(search_function):
+    names = requested_fields(SEARCH_FIELDS, SEARCH_FIELDS)
+    results = search_function(request.args.get('q', ''), limit=requested_limit())
+    data = [{name: result[name] for name in names} for result in results['data']]
+    return json_response({'count': results['count'], 'data': data})
+
+
+@api.route('/venues')
+def venues():
+    return list_entities(Venue, VENUE_FIELDS)
+
+
+@api.route('/venues/browse')
+def browse_venues():
+    return browse_entities(Venue)
+
+
+@api.route('/venues/near')
+def venues_near():
+    try:
+        place = geo.requested_search(request.args)
+    except ValueError as error:
+        raise APIError(str(error))
+    data = geo.venues_near(limit=requested_limit(), **place)
+    return json_response({'count': len(data), 'data': data})
+
+
+@api.route('/venues/search')
+def search_venues():
+    return search_entities(search.search_venues)
+
+
+@api.route('/venues/<int:venue_id>')
+def venue(venue_id):
+    return entity_detail(Venue, VENUE_FIELDS, venue_id, queries.venue_shows_statement,
+                         ['artist_id', 'artist_name', 'artist_image_link', 'start_time'])
+
+
+@api.route('/venues/<int:venue_id>/free-slots')
+def venue_free_slots(venue_id):
+    return entity_free_slots('venue_id', venue_id)
+
+
+@api.route('/artists')
+def artists():
+    return list_entities(Artist, ARTIST_FIELDS)
+
+
+@api.route('/artists/browse')
+def browse_artists():
+    return browse_entities(Artist)
+
+
+@api.route('/artists/search')
+def search_artists():
+    return search_entities(search.search_artists)
+
+
+@api.route('/artists/<int:artist_id>')
+def artist(artist_id):
+    return entity_detail(Artist, ARTIST_FIELDS, artist_id, queries.artist_shows_statement,
+                         ['venue_id', 'venue_name', 'venue_image_link', 'start_time'])
+
+
+@api.route('/artists/<int:artist_id>/free-slots')
+def artist_free_slots(artist_id):
+    return entity_free_slots('artist_id', artist_id)
+
+
+@api.route('/shows')
+def shows():
+    names = requested_fields(queries.SHOW_COLUMNS, queries.SHOW_COLUMNS)
+    try:
+        rows, next_cursor = queries.upcoming_shows_page(after=request.args.get('after'),
+                                                        limit=requested_limit(), fields=names)
+    except ValueError:
+        raise APIError('invalid cursor')
+    return json_response({'data': project(rows, names), 'next': next_cursor})
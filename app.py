@@ -3,27 +3,65 @@
 #----------------------------------------------------------------------------#
 
 import json
-import sys
 from time import strftime
-from datetime import datetime
+from datetime import datetime, timedelta
 import dateutil.parser
 import babel
+import babel.dates
+from functools import lru_cache
 from flask import (
   Flask,
+  abort,
   render_template,
   request,
   Response,
   flash,
+  jsonify,
   redirect,
+  stream_with_context,
   url_for
 )
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import SQLAlchemyError
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from flask_migrate import Migrate
-from models import db, Venue, Artist, Show
+from models import db, Venue, Artist
+from queries import (
+  artist_shows_statement,
+  entity_statement,
+  fetch_all,
+  partition_shows,
+  stream,
+  upcoming_shows_page,
+  venue_directory,
+  venue_shows_statement
+)
+import instrumentation
+import counters  # keeps the show counters in step with Show writes
+import facets
+import geo
+import writes
+import archive
+import jobs
+import tasks  # queues the background jobs that follow writes
+import search
+from cache import cache
+from api import api
+from health import health
+from aio import aio
+from bulk import fyyur_cli
+from conditional import (
+  artist_version,
+  artists_version,
+  conditional,
+  page_version,
+  shows_version,
+  venue_version,
+  venues_version
+)
 import flask_wtf
 from flask_wtf.csrf import CSRFProtect
 import config
@@ -33,27 +71,59 @@ from forms import *
 #----------------------------------------------------------------------------#
 
 app = Flask(__name__)
-app.config.from_object('config')
+app.config.from_object(config.get_config())
 moment = Moment(app)
 db.init_app(app)
 migrate = Migrate(app, db)
-
-# TODO: connect to a local postgresql database
+instrumentation.init_app(app)
+cache.init_app(app)
+app.register_blueprint(api)
+app.register_blueprint(health)
+aio.init_app(app)
+jobs.queue.init_app(app)
+app.cli.add_command(fyyur_cli)
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma"
+}
+
+@lru_cache(maxsize=None)
+def datetime_pattern(format):
+  return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format))
+
+@lru_cache(maxsize=None)
+def datetime_locale(locale):
+  return babel.Locale.parse(locale)
+
+@lru_cache(maxsize=4096)
+def format_datetime_cached(date, format, locale):
+  return datetime_pattern(format).apply(date, datetime_locale(locale))
+
+def format_datetime(value, format='medium', locale='en'):
+  if not isinstance(value, datetime):
+    value = dateutil.parser.parse(value)
+  return format_datetime_cached(value, format, locale)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+STREAM_CHUNK_EVENTS = 50
+
+def stream_template(template_name, **context):
+  # render_template, but sends the page as Jinja produces it, a few dozen
+  # template events per chunk, and asks proxies (nginx) not to buffer it
+  app.update_template_context(context)
+  template = app.jinja_env.get_template(template_name)
+  chunks = template.stream(context)
+  chunks.enable_buffering(STREAM_CHUNK_EVENTS)
+  response = Response(stream_with_context(chunks))
+  response.headers['X-Accel-Buffering'] = 'no'
+  return response
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -63,85 +133,84 @@ def index():
   return render_template('pages/home.html')
 
 
+def page_data(tags, name, compute):
+  # view data cached under the page's ETag as well as its tags: the past/upcoming
+  # split moves as shows start, and writes of other processes don't reach this
+  # process' tag versions. Not cached when there's no ETag (pending flashes).
+  version = page_version()
+  if version is None:
+    return compute()
+  return cache.get_or_set(tags, '%s:%s' % (name, version), compute)
+
 #  Venues
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@conditional(venues_version)
+@cache.cached_page(lambda: ['venues'])
 def venues():
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  data = []
-  cities = db.session.query(Venue.city, Venue.state).distinct(Venue.city, Venue.state)
-  venues = Venue.query.group_by(Venue.id, Venue.city, Venue.state).all()
-
-  for city in cities:
-    venuesData = []
-    cityName = city[0]
-    stateName = city[1]
-
-    for venue in venues:
-      if venue.city == cityName:
-        venuesData.append({
-          "id": venue.id,
-          "name": venue.name,
-          "num_upcoming_shows": db.session.query(Show).filter(Show.venue_id==venue.id).filter(Show.start_time>datetime.now()).count()
-        })
-
-    data.append({
-      "city": cityName,
-      "state": stateName,
-      "venues": venuesData
-    })
-
-  return render_template('pages/venues.html', areas=data);
+  if app.config['STREAM_LISTINGS']:
+    return stream_template('pages/venues.html', areas=venue_directory(app.config['STREAM_BATCH_SIZE']))
+  data = page_data(['venues'], 'view:venues', venue_directory)
+
+  return render_template('pages/venues.html', areas=data)
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for Hop should return "The Musical Hop".
-  # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-  search_term = request.form.get('search_term')
-  searchResults = Venue.query.filter(Venue.name.ilike('%{}%'.format(search_term))).all()
-  data = []
-
-  for searchResult in searchResults:
-    data.append({
-      "id": searchResult.id,
-      "name": searchResult.name,
-      "num_upcoming_shows": db.session.query(Show).filter(Show.venue_id==searchResult.id).filter(Show.start_time>datetime.now()).count()
-    })
-
-  response = {}
-  response['count'] = len(data)
-  response['data'] = data
-
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+  search_term = request.form.get('search_term', '')
+  response = search.search_venues(search_term)
+
+  return render_template('pages/search_venues.html', results=response, search_term=search_term)
+
+@app.route('/venues/browse')
+def browse_venues():
+  return browse_page(Venue, 'Venues')
+
+@app.route('/venues/near')
+def venues_near():
+  # venues nearest the place in the query string (?city=&state= or ?lat=&lon=), optionally within ?miles=
+  results = error = None
+  if request.args:
+    try:
+      results = geo.venues_near(**geo.requested_search(request.args))
+    except ValueError as e:
+      error = str(e)
+  return render_template('pages/venues_near.html', results=results, error=error,
+                         states=[state for state, _ in state_choices])
+
+def browse_page(model, title):
+  # /venues/browse and /artists/browse: results and facet counts for the filters in the query string
+  filters = facets.requested_filters(model, request.args)
+
+  def toggle_url(name, value):
+    # this page with ``value`` of facet ``name`` selected or, if it was, unselected
+    selected = filters.get(name, [])
+    values = [other for other in selected if other != value] if value in selected else selected + [value]
+    args = {other: other_values for other, other_values in filters.items() if other != name}
+    if values:
+      args[name] = values
+    return url_for(request.endpoint, **args)
+
+  return render_template('pages/browse.html', title=title, results=facets.browse(model, filters),
+                         filters=filters, toggle_url=toggle_url)
 
 @app.route('/venues/<int:venue_id>')
+@conditional(venue_version)
+@cache.cached_page(lambda venue_id: ['venue:%d' % venue_id])
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  venue = Venue.query.get(venue_id)
-  past_shows = []
-  upcoming_shows = []
-  shows = db.session.query(Show).join(Artist).filter(Show.venue_id == venue_id).order_by(Show.start_time)
-  for show in shows:
-    show.venue = Venue.query.filter_by(id=show.venue_id).first_or_404()
-    show.artist = Artist.query.filter_by(id=show.artist_id).first_or_404()
-    showAppend = {
-      "artist_id": show.artist_id,
-      "artist_name": show.artist.name,
-      "artist_image_link": show.artist.image_link,
-      "start_time": str(show.start_time.strftime("%m/%d/%Y, %H:%M"))
-    }
-
-    if (str(show.start_time.strftime("%m/%d/%Y, %H:%M")) < str(datetime.now().strftime("%m/%d/%Y, %H:%M"))):
-      past_shows.append(showAppend)
-
-    else:
-      upcoming_shows.append(showAppend)
-
-  data = {
+  data = page_data(['venue:%d' % venue_id], 'view:venue', lambda: venue_page(venue_id))
+  return render_template('pages/show_venue.html', venue=data)
+
+def venue_page(venue_id):
+  # independent queries; concurrent with ASYNC_QUERIES on
+  venues, shows = fetch_all(entity_statement(Venue, venue_id), venue_shows_statement(venue_id))
+  if not venues:
+    abort(404)
+  venue = venues[0]
+  past_shows, upcoming_shows = partition_shows(shows)
+
+  return {
     "id": venue_id,
     "name": venue.name,
     "genres": venue.genres,
@@ -160,148 +229,107 @@ def show_venue(venue_id):
     "upcoming_shows_count": len(upcoming_shows)
   }
 
-  return render_template('pages/show_venue.html', venue=data)
-
 #  Create Venue
 #  ----------------------------------------------------------------
 
 @app.route('/venues/create', methods=['GET'])
 def create_venue_form():
-  form = VenueForm()
+  form = NewVenueForm()
   return render_template('forms/new_venue.html', form=form)
 
 @app.route('/venues/create', methods=['POST'])
 def create_venue_submission():
-  # TODO: insert form data as a new Venue record in the db, instead
-  error = False
-  form = VenueForm(request.form, meta={'csrf': False})
+  # inserts the venue and any first shows filled in, in one transaction
+  form = NewVenueForm(request.form, meta={'csrf': False})
   if form.validate():
     try:
-      name = form.name.data
-      city = form.city.data
-      state = form.state.data
-      address = form.address.data
-      phone = form.phone.data
-      image_link = form.image_link.data
-      genres = form.genres.data
-      facebook_link = form.facebook_link.data
-      website_link = form.website_link.data
-      seeking_talent = form.seeking_talent.data
-      seeking_description = form.seeking_description.data
-      venue = Venue(name=name, city=city, state=state, address=address, phone=phone, image_link=image_link,
-                    genres=genres, facebook_link=facebook_link, website=website_link, seeking_talent=seeking_talent,
-                    seeking_description=seeking_description)
-      db.session.add(venue)
-      db.session.commit()
-
-    except:
-      error = True
-      db.session.rollback()
-      print(sys.exc_info())
-      flash('An error occurred. Venue ' + request.form['name'] + ' could not be listed.')
-
-    finally:
-      db.session.close()
+      writes.create_venue(writes.form_values(Venue, form.data), form.first_shows())
       # on successful db insert, flash success
-      if error == False:
-        flash('Venue ' + request.form['name'] + ' was successfully listed!')
-
-  else:
-    message = []
-    for field, err in form.errors.items():
-      message.append(field + ' ' + '|'.join(err))
-    flash('Errors ' + str(message))
+      flash('Venue ' + form.name.data + ' was successfully listed!')
+    except writes.WriteError as e:
+      add_errors(form, e.errors)
+    except SQLAlchemyError:
+      app.logger.exception('%s failed', request.endpoint)
+      flash('An error occurred. Venue ' + form.name.data + ' could not be listed.')
+  messages = error_messages(form)
+  if messages:
+    flash('Errors ' + str(messages))
 
   return render_template('pages/home.html')
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@app.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
-  # TODO: Complete this endpoint for taking a venue_id, and using
-  # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
-  error = False
-  try:
-    toDelete = Venue.query.get(venue_id)
-    deletedName = toDelete.name
-    db.session.delete(Venue.query.get(toDelete))
-    db.session.commit()
-  except:
-    error = True
-    db.session.rollback()
-    print(sys.exc_info())
-    flash('Error: ' + deletedName + ' could not be deleted')
-  finally:
-    db.session.close()
-
-  flash(deletedName + ' was successfully deleted')
-
   # BONUS CHALLENGE: Implement a button to de lete a Venue on a Venue Page, have it so that
   # clicking that button delete it from the db then redirect the user to the homepage
+  return delete_entity(Venue, venue_id, 'Venue')
+
+def delete_entity(model, id, kind):
+  # Set-based delete that archives the shows (archive.py); a venue or artist
+  # with a long show history is deleted by a background job instead.
+  try:
+    deleted = archive.delete(model, id)
+  except SQLAlchemyError:
+    db.session.rollback()
+    app.logger.exception('%s failed', request.endpoint)
+    flash('An error occurred. %s %d could not be deleted.' % (kind, id))
+    return render_template('pages/home.html'), 500
+  if deleted is None:
+    abort(404)
+  name, scheduled = deleted
+  if scheduled:
+    flash(name + ' has a long show history; it will be deleted once its shows are archived')
+  else:
+    flash(name + ' was successfully deleted')
   return render_template('pages/home.html')
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@conditional(artists_version)
+@cache.cached_page(lambda: ['artists'])
 def artists():
-  # TODO: replace with real data returned from querying the database
-  data = []
-  artists = Artist.query.with_entities(Artist.id, Artist.name).all()
-
-  for artist in artists:
-    data.append({
-      "id": artist.id,
-      "name": artist.name
-    })
+  if app.config['STREAM_LISTINGS']:
+    return stream_template('pages/artists.html', artists=stream(artist_rows(), app.config['STREAM_BATCH_SIZE']))
+  data = page_data(['artists'], 'view:artists', artist_list)
 
   return render_template('pages/artists.html', artists=data)
 
+def artist_rows():
+  return Artist.query.with_entities(Artist.id, Artist.name).order_by(Artist.id)
+
+def artist_list():
+  return [{
+    "id": artist.id,
+    "name": artist.name
+  } for artist in artist_rows()]
+
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
-  # search for "band" should return "The Wild Sax Band".
-  search_term = request.form.get('search_term')
-  searchResults = Artist.query.filter(Artist.name.ilike('%{}%'.format(search_term))).all()
-  data = []
-
-  for searchResult in searchResults:
-    data.append({
-      "id": searchResult.id,
-      "name": searchResult.name,
-      "num_upcoming_shows": db.session.query(Show).filter(Show.artist_id == searchResult.id).filter(
-        Show.start_time > datetime.now()).count()
-    })
-
-  response = {}
-  response['count'] = len(data)
-  response['data'] = data
-
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  search_term = request.form.get('search_term', '')
+  response = search.search_artists(search_term)
+
+  return render_template('pages/search_artists.html', results=response, search_term=search_term)
+
+@app.route('/artists/browse')
+def browse_artists():
+  return browse_page(Artist, 'Artists')
 
 @app.route('/artists/<int:artist_id>')
+@conditional(artist_version)
+@cache.cached_page(lambda artist_id: ['artist:%d' % artist_id])
 def show_artist(artist_id):
   # shows the artist page with the given artist_id
-  # TODO: replace with real artist data from the artist table, using artist_id
-  artist = Artist.query.get(artist_id)
-  past_shows = []
-  upcoming_shows = []
-  shows = db.session.query(Show).join(Venue).filter(Show.artist_id == artist_id).order_by(Show.start_time)
-  for show in shows:
-    show.venue = Venue.query.filter_by(id=show.venue_id).first_or_404()
-    show.artist = Artist.query.filter_by(id=show.artist_id).first_or_404()
-    showAppend = {
-      "venue_id": show.venue_id,
-      "venue_name": show.venue.name,
-      "venue_image_link": show.venue.image_link,
-      "start_time": str(show.start_time.strftime("%m/%d/%Y, %H:%M"))
-    }
-
-    if (str(show.start_time.strftime("%m/%d/%Y, %H:%M")) < str(datetime.now().strftime("%m/%d/%Y, %H:%M"))):
-      past_shows.append(showAppend)
-
-    else:
-      upcoming_shows.append(showAppend)
-
-  data = {
+  data = page_data(['artist:%d' % artist_id], 'view:artist', lambda: artist_page(artist_id))
+  return render_template('pages/show_artist.html', artist=data)
+
+def artist_page(artist_id):
+  artists, shows = fetch_all(entity_statement(Artist, artist_id), artist_shows_statement(artist_id))
+  if not artists:
+    abort(404)
+  artist = artists[0]
+  past_shows, upcoming_shows = partition_shows(shows)
+
+  return {
     "id": artist_id,
     "name": artist.name,
     "genres": artist.genres,
@@ -319,7 +347,9 @@ def show_artist(artist_id):
     "upcoming_shows_count": len(upcoming_shows)
   }
 
-  return render_template('pages/show_artist.html', artist=data)
+@app.route('/artists/<int:artist_id>', methods=['DELETE'])
+def delete_artist(artist_id):
+  return delete_entity(Artist, artist_id, 'Artist')
 
 #  Update
 #  ----------------------------------------------------------------
@@ -329,45 +359,24 @@ def edit_artist(artist_id):
 
   # TODO: populate form with fields from artist with ID <artist_id>
   artist = Artist.query.get_or_404(artist_id)
-  form = ArtistForm(obj=artist)
+  form = ArtistForm(obj=artist, website_link=artist.website)
 
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
-  # TODO: take values from the form submitted, and update existing
-  # artist record with ID <artist_id> using the new attributes
-  error = False
-  artist = Artist.query.filter_by(id=artist_id).first_or_404()
+  # updates only the columns whose values changed
   form = ArtistForm(request.form, meta={'csrf': False})
   if form.validate():
     try:
-      artist.name = form.name.data
-      artist.city = form.city.data
-      artist.state = form.state.data
-      artist.phone = form.phone.data
-      artist.image_link = form.image_link.data
-      artist.genres = form.genres.data
-      artist.facebook_link = form.facebook_link.data
-      artist.website_link = form.website_link.data
-      artist.seeking_venue = form.seeking_venue.data
-      artist.seeking_description = form.seeking_description.data
-      db.session.commit()
-    except:
-      error = True
-      db.session.rollback()
-      print(sys.exc_info())
-      flash('An error occurred. Artist ' + request.name + ' could not be edited.')
-    finally:
-      db.session.close()
-      # on successful db insert, flash success
-      if error == False:
-        flash('Artist ' + form.name.data + ' was successfully edited!')
+      if writes.update_artist(artist_id, writes.form_values(Artist, form.data)) is None:
+        abort(404)
+      flash('Artist ' + form.name.data + ' was successfully edited!')
+    except SQLAlchemyError:
+      app.logger.exception('%s failed', request.endpoint)
+      flash('An error occurred. Artist ' + form.name.data + ' could not be edited.')
   else:
-    message = []
-    for field, err in form.errors.items():
-      message.append(field + ' ' + '|'.join(err))
-    flash('Errors ' + str(message))
+    flash('Errors ' + str(error_messages(form)))
 
   return redirect(url_for('show_artist', artist_id=artist_id))
 
@@ -377,45 +386,24 @@ def edit_venue(venue_id):
 
   # TODO: populate form with values from venue with ID <venue_id>
   venue = Venue.query.get_or_404(venue_id)
-  form = VenueForm(obj=venue)
+  form = VenueForm(obj=venue, website_link=venue.website)
 
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
-  # TODO: take values from the form submitted, and update existing
-  # venue record with ID <venue_id> using the new attributes
-  error = False
-  venue = Venue.query.filter_by(id=venue_id).first_or_404()
+  # updates only the columns whose values changed
   form = VenueForm(request.form, meta={'csrf': False})
   if form.validate():
     try:
-      venue.name = form.name.data
-      venue.city = form.city.data
-      venue.state = form.state.data
-      venue.phone = form.phone.data
-      venue.image_link = form.image_link.data
-      venue.genres = form.genres.data
-      venue.facebook_link = form.facebook_link.data
-      venue.website_link = form.website_link.data
-      venue.seeking_talent = form.seeking_talent.data
-      venue.seeking_description = form.seeking_description.data
-      db.session.commit()
-    except:
-      error = True
-      db.session.rollback()
-      print(sys.exc_info())
-      flash('An error occurred. Venue ' + request.name + ' could not be edited.')
-    finally:
-      db.session.close()
-      # on successful db insert, flash success
-      if error == False:
-        flash('Venue ' + form.name.data + ' was successfully edited!')
+      if writes.update_venue(venue_id, writes.form_values(Venue, form.data)) is None:
+        abort(404)
+      flash('Venue ' + form.name.data + ' was successfully edited!')
+    except SQLAlchemyError:
+      app.logger.exception('%s failed', request.endpoint)
+      flash('An error occurred. Venue ' + form.name.data + ' could not be edited.')
   else:
-    message = []
-    for field, err in form.errors.items():
-      message.append(field + ' ' + '|'.join(err))
-    flash('Errors ' + str(message))
+    flash('Errors ' + str(error_messages(form)))
 
   return redirect(url_for('show_venue', venue_id=venue_id))
 
@@ -430,42 +418,17 @@ def create_artist_form():
 @app.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   # called upon submitting the new artist listing form
-  # TODO: insert form data as a new Venue record in the db, instead
-  error = False
   form = ArtistForm(request.form, meta={'csrf': False})
   if form.validate():
     try:
-      name = form.name.data
-      city = form.city.data
-      state = form.state.data
-      phone = form.phone.data
-      image_link = form.image_link.data
-      genres = form.genres.data
-      facebook_link = form.facebook_link.data
-      website_link = form.website_link.data
-      seeking_venue = form.seeking_venue.data
-      seeking_description = form.seeking_description.data
-      artist = Artist(name=name, city=city, state=state, phone=phone, image_link=image_link,
-                    genres=genres, facebook_link=facebook_link, website=website_link, seeking_venue=seeking_venue,
-                    seeking_description=seeking_description)
-      db.session.add(artist)
-      db.session.commit()
-    except:
-      error = True
-      db.session.rollback()
-      print(sys.exc_info())
-      flash('An error occurred. Artist ' + request.name + ' could not be listed.')
-    finally:
-      db.session.close()
+      writes.create_artist(writes.form_values(Artist, form.data))
       # on successful db insert, flash success
-      if error == False:
-        flash('Artist ' + request.form['name'] + ' was successfully listed!')
+      flash('Artist ' + form.name.data + ' was successfully listed!')
+    except SQLAlchemyError:
+      app.logger.exception('%s failed', request.endpoint)
+      flash('An error occurred. Artist ' + form.name.data + ' could not be listed.')
   else:
-    message = []
-    for field, err in form.errors.items():
-      message.append(field + ' ' + '|'.join(err))
-    flash('Errors ' + str(message))
-
+    flash('Errors ' + str(error_messages(form)))
 
   return render_template('pages/home.html')
 
@@ -473,27 +436,21 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@conditional(shows_version)
+@cache.cached_page(lambda: ['shows'])
 def shows():
   # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  data = []
-  shows = Show.query.order_by(Show.start_time).all()
-
-  for show in shows:
-    if show.start_time > datetime.now():
-      show.venue = Venue.query.filter_by(id=show.venue_id).first_or_404()
-      show.artist = Artist.query.filter_by(id=show.artist_id).first_or_404()
-      data.append({
-        "venue_id": show.venue_id,
-        "venue_name": show.venue.name,
-        "artist_id": show.artist_id,
-        "artist_name": show.artist.name,
-        "artist_image_link": show.artist.image_link,
-        "start_time": str(show.start_time.strftime("%m/%d/%Y, %H:%M"))
-      })
-
-  return render_template('pages/shows.html', shows=data)
+  after = request.args.get('after')
+  try:
+    data, next_cursor = page_data(
+      ['shows'], 'view:shows:%s' % after,
+      lambda: upcoming_shows_page(after=after, limit=app.config['SHOWS_PAGE_SIZE']))
+  except ValueError:
+    abort(400)
+
+  if app.config['SHOWS_STREAM'] or app.config['STREAM_LISTINGS']:
+    return stream_template('pages/shows.html', shows=data, next_cursor=next_cursor)
+  return render_template('pages/shows.html', shows=data, next_cursor=next_cursor)
 
 @app.route('/shows/create')
 def create_shows():
@@ -504,35 +461,30 @@ def create_shows():
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
-  # TODO: insert form data as a new Show record in the db, instead
-  error = False
   form = ShowForm(request.form, meta={'csrf': False})
   if form.validate():
+    start_time = form.start_time.data
     try:
-      artist_id = form.artist_id.data
-      venue_id = form.venue_id.data
-      start_time = form.start_time.data
-      show = Show(artist_id = artist_id, venue_id=venue_id, start_time=start_time)
-      db.session.add(show)
-      db.session.commit()
-    except:
-      error = True
-      db.session.rollback()
-      print(sys.exc_info())
-      flash('An error occurred. Show could not be listed.')
-    finally:
-      db.session.close()
+      # rejects unknown ids and double bookings, holding the artist and venue until commit
+      writes.create_show({'artist_id': form.artist_id.data, 'venue_id': form.venue_id.data, 'start_time': start_time,
+                          'end_time': start_time + timedelta(minutes=form.duration.data)})
       # on successful db insert, flash success
-      if error == False:
-        flash('Show was successfully listed!')
-  else:
-    message = []
-    for field, err in form.errors.items():
-      message.append(field + ' ' + '|'.join(err))
-    flash('Errors ' + str(message))
+      flash('Show was successfully listed!')
+    except writes.WriteError as e:
+      add_errors(form, e.errors)
+    except SQLAlchemyError:
+      app.logger.exception('%s failed', request.endpoint)
+      flash('An error occurred. Show could not be listed.')
+  messages = error_messages(form)
+  if messages:
+    flash('Errors ' + str(messages))
 
   return render_template('pages/home.html')
 
+@app.route('/cache/stats')
+def cache_stats():
+  return jsonify(cache.stats)
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -542,7 +494,7 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
+if not app.debug and not app.testing:
     file_handler = FileHandler('error.log')
     file_handler.setFormatter(
         Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
@@ -0,0 +1,106 @@
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import DateTime, func, insert, literal, select
+
+from models import db, Venue, Artist, Show, ShowArchive
+from cache import cache
+import counters
+import jobs
+import signals
+
+#----------------------------------------------------------------------------#
+# Deleting venues and artists.
+#----------------------------------------------------------------------------#
+
+# A venue or artist is deleted with set-based statements, without loading it
+# or its shows into the session: its shows are copied to ShowArchive with
+# INSERT ... SELECT, counted out of their partners' counters with one UPDATE
+# per table, removed with one DELETE, and then the row itself is deleted.
+# One with more than DELETE_INLINE_SHOWS shows is left to an 'archive' job
+# (jobs.py), which moves its shows ARCHIVE_BATCH_SIZE at a time in short
+# transactions and deletes it last; until then it stays listed.
+
+ARCHIVE_COLUMNS = ['id', 'artist_id', 'venue_id', 'start_time', 'end_time']
+
+# Models by table name, as jobs carry them in their JSON arguments
+MODELS = {'Venue': Venue, 'Artist': Artist}
+
+
+def tags(model, id):
+    """Cache tags a delete invalidates: the partners' counters change, so
+    both listings go along with the pages the entity's shows appear on."""
+    stale = cache.venue_tags(id) if model is Venue else cache.artist_tags(id)
+    return sorted(set(stale) | {'venues', 'artists'})
+
+
+def archive_shows(connection, criteria):
+    """Move the shows matching ``criteria`` to ShowArchive; returns how
+    many moved."""
+    counters.discount(connection, criteria)
+    columns = [Show.__table__.c[name] for name in ARCHIVE_COLUMNS]
+    connection.execute(insert(ShowArchive).from_select(
+        ARCHIVE_COLUMNS + ['archived_at'],
+        select(*columns, literal(datetime.utcnow(), DateTime)).where(*criteria)))
+    return connection.execute(Show.__table__.delete().where(*criteria)).rowcount
+
+
+def delete(model, id):
+    """Delete venue or artist ``id``, archiving its shows. Returns (name,
+    scheduled), scheduled being True when it has too many shows to delete
+    within the request and an archive job was queued to do it, or None if
+    there is no such row."""
+    table = model.__table__
+    connection = db.session.connection()
+    row = connection.execute(select(table.c.name).where(table.c.id == id).with_for_update()).first()
+    if row is None:
+        db.session.rollback()
+        return None
+    key = counters.SHOW_KEYS[model]
+    shows = connection.execute(select(func.count(Show.id)).where(key == id)).scalar()
+    if shows > current_app.config['DELETE_INLINE_SHOWS']:
+        jobs.enqueue('archive', unique=True, model=model.__name__, id=id)
+        db.session.commit()
+        return row.name, True
+    stale = tags(model, id)
+    signals.entity_deleted.send(model, id=id)
+    archive_shows(connection, [key == id])
+    connection.execute(table.delete().where(table.c.id == id))
+    db.session.commit()
+    cache.invalidate(*stale)
+    return row.name, False
+
+
+def archive_in_batches(model, id, batch_size):
+    """Archive the shows of ``id`` ``batch_size`` at a time, committing after
+    each batch, then delete it as delete() does. Returns how many shows
+    were archived."""
+    key = counters.SHOW_KEYS[model]
+    stale = tags(model, id)
+    archived = 0
+    while True:
+        connection = db.session.connection()
+        # locked, so a second job on the same row waits and finds them moved
+        ids = connection.execute(
+            select(Show.id).where(key == id).order_by(Show.id).limit(batch_size).with_for_update()
+        ).scalars().all()
+        if not ids:
+            break
+        archived += archive_shows(connection, [Show.id.in_(ids)])
+        db.session.commit()
+
+    # shows booked in between are archived with the row, under its lock
+    table = model.__table__
+    if connection.execute(select(table.c.id).where(table.c.id == id).with_for_update()).first() is not None:
+        signals.entity_deleted.send(model, id=id)
+        archived += archive_shows(connection, [key == id])
+        connection.execute(table.delete().where(table.c.id == id))
+    db.session.commit()
+    cache.invalidate(*stale)
+    return archived
+
+
+@jobs.task('archive')
+def archive_job(model, id):
+    """Job finishing delete() for a venue or artist with a long show history."""
+    archive_in_batches(MODELS[model], id, current_app.config['ARCHIVE_BATCH_SIZE'])
@@ -0,0 +1,13 @@
+"""ASGI entry point, for serving Fyyur with uvicorn or hypercorn:
+
+    ASYNC_QUERIES=1 uvicorn asgi:application --workers 4
+
+The Flask app runs in the server's thread pool (asgiref's WsgiToAsgi); with
+ASYNC_QUERIES on, the independent queries of each page run concurrently on
+the asyncio engine (see aio.py).
+"""
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app
+
+application = WsgiToAsgi(app)
@@ -0,0 +1,110 @@
+"""Throughput of the venue/artist pages under concurrent load, with the page
+queries run one after another (the default) and concurrently (ASYNC_QUERIES).
+
+    python -m benchmarks.concurrency --database-url postgresql://localhost:5432/fyyur_bench
+                                     [--concurrency 1,8,32,64] [--requests 2000]
+
+Serves the app with a threaded WSGI server and requests random /venues/<id>
+and /artists/<id> pages from --concurrency client threads, with the page cache
+off. Needs a database separate connections can share: a scratch Postgres
+(asyncpg) or, by default, a temporary SQLite file (aiosqlite). Tables are
+dropped and recreated.
+"""
+import argparse
+import http.client
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import make_server
+
+from app import app
+from aio import aio
+from cache import cache
+from models import db
+from benchmarks.seed import seed
+
+
+def serve():
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def load(port, paths, concurrency, requests):
+    local = threading.local()
+
+    def get(path):
+        if not hasattr(local, 'connection'):
+            local.connection = http.client.HTTPConnection('127.0.0.1', port)
+        start = time.perf_counter()
+        local.connection.request('GET', path)
+        response = local.connection.getresponse()
+        response.read()
+        assert response.status == 200, (path, response.status)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        timings = sorted(pool.map(get, paths[:requests]))
+    elapsed = time.perf_counter() - start
+    return requests / elapsed, timings[len(timings) // 2], timings[int(len(timings) * 0.95)]
+
+
+def set_mode(concurrent):
+    app.config['ASYNC_QUERIES'] = concurrent
+    app.extensions.pop('aio', None)
+    aio.init_app(app)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url')
+    parser.add_argument('--venues', type=int, default=1000)
+    parser.add_argument('--shows-per-venue', type=int, default=20)
+    parser.add_argument('--concurrency', default='1,8,32,64')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.database_url is None:
+        args.database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'fyyur_bench.db')
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+    app.config['SQLALCHEMY_ECHO'] = False
+    app.config['SLOW_REQUEST_MS'] = float('inf')
+    app.config['CACHE_TYPE'] = 'null'
+    cache.init_app(app)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed(venues=args.venues, artists=args.venues // 2, shows=args.venues * args.shows_per_venue, seed=args.seed)
+        db.session.remove()
+
+    rng = random.Random(args.seed)
+    paths = [rng.choice(['/venues/%d', '/artists/%d']) % rng.randint(1, args.venues // 2)
+             for _ in range(args.requests)]
+    server = serve()
+
+    print('%11s %12s %10s %10s %10s' % ('concurrency', 'queries', 'req/s', 'p50 (ms)', 'p95 (ms)'))
+    try:
+        for concurrency in [int(n) for n in args.concurrency.split(',')]:
+            for concurrent in (False, True):
+                set_mode(concurrent)
+                load(server.port, paths, concurrency, min(args.requests, 50))  # warm up
+                throughput, p50, p95 = load(server.port, paths, concurrency, args.requests)
+                print('%11d %12s %10.0f %10.2f %10.2f' % (concurrency, 'concurrent' if concurrent else 'sequential',
+                                                          throughput, p50 * 1000, p95 * 1000))
+    finally:
+        server.shutdown()
+        with app.app_context():
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Query plans of the hot query paths with and without their indexes.
+
+    python -m benchmarks.explain [--database-url URL] [--venues 5000]
+
+Seeds a scratch database (tables are dropped and recreated), then prints the
+plan of each query with the indexes dropped and again with them created, so the
+change from a sequential scan to an index scan is visible. Uses EXPLAIN on
+Postgres and EXPLAIN QUERY PLAN on SQLite.
+"""
+import argparse
+from datetime import datetime
+
+from app import app
+from models import db, Venue, Artist, Show
+from benchmarks.seed import seed
+
+
+def hot_queries(now):
+    """(index, query) pairs for the statements the views issue most."""
+    index = {index.name: index
+             for model in (Venue, Artist, Show)
+             for index in model.__table__.indexes}
+    return [
+        (index['ix_Show_venue_id_start_time'],
+         db.session.query(Show.id).filter(Show.venue_id == 1, Show.start_time > now)),
+        (index['ix_Show_artist_id_start_time'],
+         db.session.query(Show.id).filter(Show.artist_id == 1, Show.start_time > now)),
+        (index['ix_Show_start_time_id'],
+         db.session.query(Show.id).filter(Show.start_time > now)
+            .order_by(Show.start_time, Show.id).limit(50)),
+        (index['ix_Venue_state_city'],
+         db.session.query(Venue.id).filter(Venue.city == 'Austin', Venue.state == 'TX')),
+        (index['ix_Venue_name_trgm'],
+         db.session.query(Venue.id).filter(Venue.name.ilike('%nue 42%'))),
+        (index['ix_Artist_name_trgm'],
+         db.session.query(Artist.id).filter(Artist.name.ilike('%ist 42%'))),
+    ]
+
+
+def explain(query):
+    dialect = db.engine.dialect
+    statement = str(query.statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect.name == 'sqlite' else 'EXPLAIN '
+    rows = db.session.execute(db.text(prefix + statement)).fetchall()
+    return [str(row[-1]) for row in rows]
+
+
+def analyze():
+    db.session.execute(db.text('ANALYZE'))
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-url', default='sqlite://')
+    parser.add_argument('--venues', type=int, default=5000)
+    parser.add_argument('--shows-per-venue', type=int, default=20)
+    args = parser.parse_args()
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+    app.config['SQLALCHEMY_ECHO'] = False
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed(venues=args.venues, artists=args.venues, shows=args.venues * args.shows_per_venue)
+        now = datetime.now()
+
+        queries = hot_queries(now)
+
+        for index, _ in queries:
+            index.drop(db.engine)
+        analyze()
+        before = [explain(query) for _, query in queries]
+
+        for index, _ in queries:
+            index.create(db.engine)
+        analyze()
+        after = [explain(query) for _, query in queries]
+
+        for (index, _), without_plan, with_plan in zip(queries, before, after):
+            print('== %s' % index.name)
+            print('-- without index')
+            print('\n'.join(without_plan))
+            print('-- with index')
+            print('\n'.join(with_plan))
+            print()
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
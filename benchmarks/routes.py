@@ -0,0 +1,303 @@
+"""Latency, query count and peak memory of every route at several scales.
+
+    python -m benchmarks.routes [--database-url URL] [--scales 100,1000,5000]
+                                [--output results.json] [--compare before.json]
+
+For each scale (number of venues) the tables are dropped, recreated and seeded
+with benchmarks.seed, then every route is requested --runs times through the
+Flask test client. p50/p95/p99 latency, SQL statements per request and the
+peak Python memory of one request are printed, and written as JSON with
+--output. --compare prints the change against an earlier JSON file.
+
+The page cache is off unless --cache is given, so the numbers are those of a
+cold request. Routes with a MAX_QUERIES budget (set with FYYUR_ENV=testing)
+fail with AssertionError when a request runs more statements than that. Point --database-url at a scratch database only.
+"""
+import argparse
+import json
+import math
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy.engine import make_url
+
+from app import app
+from cache import cache
+from instrumentation import assert_max_queries
+from models import db, Venue, Artist
+from benchmarks.seed import seed
+
+#----------------------------------------------------------------------------#
+# Routes.
+#----------------------------------------------------------------------------#
+
+VENUE_FORM = {
+    'name': 'Benchmark Venue',
+    'city': 'Austin',
+    'state': 'TX',
+    'address': '1 Benchmark St',
+    'phone': '512-555-0100',
+    'genres': ['Jazz', 'Blues'],
+    'facebook_link': 'https://www.facebook.com/benchmark',
+    'image_link': '',
+    'website_link': '',
+    'seeking_description': '',
+}
+
+ARTIST_FORM = dict(VENUE_FORM, name='Benchmark Artist')
+del ARTIST_FORM['address']
+
+
+def entity_id(model):
+    def pick(rng, scale):
+        return rng.randint(1, db.session.query(db.func.max(model.id)).scalar())
+    return pick
+
+
+def new_venue(rng, scale):
+    """A venue to delete, inserted before the timed request."""
+    result = db.session.execute(Venue.__table__.insert(), {
+        'name': 'Doomed Venue', 'city': 'Austin', 'state': 'TX', 'address': '1 St',
+        'phone': '512-555-0100', 'genres': ['Jazz'],
+    })
+    db.session.commit()
+    return result.inserted_primary_key[0]
+
+
+def new_artist(rng, scale):
+    """An artist to delete, inserted before the timed request."""
+    result = db.session.execute(Artist.__table__.insert(), {
+        'name': 'Doomed Artist', 'city': 'Austin', 'state': 'TX',
+        'phone': '512-555-0100', 'genres': ['Jazz'],
+    })
+    db.session.commit()
+    return result.inserted_primary_key[0]
+
+
+def show_form(rng, scale):
+    return {
+        'artist_id': entity_id(Artist)(rng, scale),
+        'venue_id': entity_id(Venue)(rng, scale),
+        'start_time': (datetime.now() + timedelta(days=rng.randint(1, 365))).strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+class Route:
+    """One request to time: ``path`` may contain {id}, filled in by ``ids``
+    before each run; ``data`` is form data or a function returning it."""
+
+    def __init__(self, endpoint, path, method='GET', data=None, ids=None, status=(200,)):
+        self.endpoint = endpoint
+        self.path = path
+        self.method = method
+        self.data = data
+        self.ids = ids
+        self.status = status
+
+    def prepare(self, rng, scale):
+        path = self.path.format(id=self.ids(rng, scale)) if self.ids else self.path
+        data = self.data(rng, scale) if callable(self.data) else self.data
+        return path, data
+
+
+ROUTES = [
+    Route('index', '/'),
+    Route('venues', '/venues'),
+    Route('search_venues', '/venues/search', 'POST', {'search_term': 'venue 1'}),
+    Route('browse_venues', '/venues/browse?genres=Jazz&genres=Blues&state=CA'),
+    Route('venues_near', '/venues/near?city=San+Francisco&state=CA&miles=50&seeking_talent=true'),
+    Route('show_venue', '/venues/{id}', ids=entity_id(Venue)),
+    Route('create_venue_form', '/venues/create'),
+    Route('create_venue_submission', '/venues/create', 'POST', VENUE_FORM),
+    Route('delete_venue', '/venues/{id}', 'DELETE', ids=new_venue),
+    Route('edit_venue', '/venues/{id}/edit', ids=entity_id(Venue)),
+    Route('edit_venue_submission', '/venues/{id}/edit', 'POST', VENUE_FORM, ids=entity_id(Venue),
+          status=(200, 302)),
+    Route('artists', '/artists'),
+    Route('search_artists', '/artists/search', 'POST', {'search_term': 'artist 1'}),
+    Route('browse_artists', '/artists/browse?genres=Jazz&seeking_venue=true'),
+    Route('show_artist', '/artists/{id}', ids=entity_id(Artist)),
+    Route('delete_artist', '/artists/{id}', 'DELETE', ids=new_artist),
+    Route('create_artist_form', '/artists/create'),
+    Route('create_artist_submission', '/artists/create', 'POST', ARTIST_FORM),
+    Route('edit_artist', '/artists/{id}/edit', ids=entity_id(Artist)),
+    Route('edit_artist_submission', '/artists/{id}/edit', 'POST', ARTIST_FORM, ids=entity_id(Artist),
+          status=(200, 302)),
+    Route('shows', '/shows'),
+    Route('create_shows', '/shows/create'),
+    Route('create_show_submission', '/shows/create', 'POST', show_form),
+    Route('cache_stats', '/cache/stats'),
+    Route('api.venues', '/api/v1/venues'),
+    Route('api.search_venues', '/api/v1/venues/search?q=venue'),
+    Route('api.browse_venues', '/api/v1/venues/browse?genres=Jazz&genres=Blues&state=CA'),
+    Route('api.venues_near', '/api/v1/venues/near?lat=40.71&lon=-74.01&limit=20'),
+    Route('api.venue', '/api/v1/venues/{id}', ids=entity_id(Venue)),
+    Route('api.venue_free_slots', '/api/v1/venues/{id}/free-slots', ids=entity_id(Venue)),
+    Route('api.artists', '/api/v1/artists'),
+    Route('api.search_artists', '/api/v1/artists/search?q=artist'),
+    Route('api.browse_artists', '/api/v1/artists/browse?genres=Jazz&seeking_venue=true'),
+    Route('api.artist', '/api/v1/artists/{id}', ids=entity_id(Artist)),
+    Route('api.artist_free_slots', '/api/v1/artists/{id}/free-slots', ids=entity_id(Artist)),
+    Route('api.shows', '/api/v1/shows'),
+    Route('health.healthz', '/healthz'),
+    Route('health.metrics', '/metrics'),
+]
+
+#----------------------------------------------------------------------------#
+# Measurement.
+#----------------------------------------------------------------------------#
+
+def percentile(values, percent):
+    """Nearest-rank percentile of sorted ``values``."""
+    return values[max(int(math.ceil(percent / 100.0 * len(values))) - 1, 0)]
+
+
+def request(client, route, path, data):
+    response = client.open(path, method=route.method, data=data)
+    assert response.status_code in route.status, \
+        '%s %s returned %d' % (route.method, path, response.status_code)
+
+
+def measure(client, route, runs, rng, scale):
+    # Going over the endpoint's MAX_QUERIES budget (FYYUR_ENV=testing) fails the run
+    budget = app.config['MAX_QUERIES'].get(route.endpoint, math.inf)
+    timings, queries = [], []
+    for _ in range(runs + 1):
+        path, data = route.prepare(rng, scale)
+        with assert_max_queries(budget) as statements:
+            start = time.perf_counter()
+            request(client, route, path, data)
+            timings.append(time.perf_counter() - start)
+        queries.append(len(statements))
+    # the first run warms up templates and compiled statements
+    timings, queries = sorted(timings[1:]), queries[1:]
+
+    path, data = route.prepare(rng, scale)
+    tracemalloc.start()
+    try:
+        request(client, route, path, data)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'scale': scale,
+        'route': route.endpoint,
+        'method': route.method,
+        'path': route.path,
+        'runs': runs,
+        'p50_ms': round(percentile(timings, 50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 95) * 1000, 3),
+        'p99_ms': round(percentile(timings, 99) * 1000, 3),
+        'mean_ms': round(sum(timings) / len(timings) * 1000, 3),
+        'queries': max(queries),
+        'peak_kb': round(peak / 1024.0, 1),
+    }
+
+#----------------------------------------------------------------------------#
+# Reporting.
+#----------------------------------------------------------------------------#
+
+def revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    header = '%8s %-26s %9s %9s %9s %8s %10s' % ('scale', 'route', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)',
+                                                'queries', 'peak (KB)')
+    if baseline is not None:
+        header += ' %10s %10s' % ('p50 diff', 'queries')
+        baseline = {(result['scale'], result['route']): result for result in baseline['results']}
+    print(header)
+    for result in results:
+        line = '%8d %-26s %9.2f %9.2f %9.2f %8d %10.1f' % (
+            result['scale'], result['route'], result['p50_ms'], result['p95_ms'], result['p99_ms'],
+            result['queries'], result['peak_kb'])
+        if baseline is not None:
+            before = baseline.get((result['scale'], result['route']))
+            if before is None:
+                line += ' %10s %10s' % ('-', '-')
+            else:
+                change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0
+                line += ' %+9.1f%% %+10d' % (change, result['queries'] - before['queries'])
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default='sqlite://')
+    parser.add_argument('--scales', default='100,1000,5000', help='Venue counts to seed, comma separated.')
+    parser.add_argument('--artists-per-venue', type=float, default=0.5)
+    parser.add_argument('--shows-per-venue', type=int, default=10)
+    parser.add_argument('--cities', type=int, default=8)
+    parser.add_argument('--days', type=int, default=365, help='Shows are spread this many days either side of now.')
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--routes', help='Only these endpoints, comma separated.')
+    parser.add_argument('--cache', action='store_true', help='Keep the page cache on.')
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--compare', help='Print the change against this earlier JSON file.')
+    args = parser.parse_args()
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+    app.config['SQLALCHEMY_ECHO'] = False
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['SLOW_REQUEST_MS'] = float('inf')
+    app.config['CACHE_TYPE'] = 'simple' if args.cache else 'null'
+    cache.init_app(app)
+
+    routes = ROUTES
+    if args.routes:
+        names = args.routes.split(',')
+        routes = [route for route in ROUTES if route.endpoint in names]
+    covered = {route.endpoint for route in ROUTES}
+    missing = sorted(rule.endpoint for rule in app.url_map.iter_rules()
+                     if rule.endpoint != 'static' and rule.endpoint not in covered)
+    if missing:
+        print('not benchmarked: %s' % ', '.join(missing))
+
+    results = []
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        for scale in [int(n) for n in args.scales.split(',')]:
+            db.drop_all()
+            db.create_all()
+            seed(venues=scale, artists=max(int(scale * args.artists_per_venue), 1),
+                 shows=scale * args.shows_per_venue, seed=args.seed, cities=args.cities, days=args.days)
+            client = app.test_client()
+            rng = random.Random(args.seed)
+            for route in routes:
+                results.append(measure(client, route, args.runs, rng, scale))
+                db.session.remove()
+        db.drop_all()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as stream:
+            baseline = json.load(stream)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as stream:
+            json.dump({
+                'meta': {
+                    'created': datetime.now().isoformat(timespec='seconds'),
+                    'revision': revision(),
+                    'database': dialect,
+                    'python': platform.python_version(),
+                    'args': dict(vars(args), database_url=repr(make_url(args.database_url))),
+                },
+                'results': results,
+            }, stream, indent=2)
+
+
+if __name__ == '__main__':
+    main()
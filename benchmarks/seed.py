@@ -0,0 +1,108 @@
+"""Seeded synthetic data for the benchmarks."""
+import random
+from datetime import datetime, timedelta
+
+from models import db, Venue, Artist, Show
+import counters
+import geo
+from validation import state_choices, genre_choices
+
+CITIES = [
+    ('San Francisco', 'CA'),
+    ('Los Angeles', 'CA'),
+    ('New York', 'NY'),
+    ('Brooklyn', 'NY'),
+    ('Austin', 'TX'),
+    ('Chicago', 'IL'),
+    ('Seattle', 'WA'),
+    ('Nashville', 'TN'),
+]
+
+
+def city_list(count):
+    """``count`` (city, state) pairs: the CITIES above, then made-up ones."""
+    states = [state for state, _ in state_choices]
+    extra = [('City %d' % i, states[i % len(states)]) for i in range(max(count - len(CITIES), 0))]
+    return (CITIES + extra)[:count]
+
+
+def seed(venues=100, artists=100, shows=1000, seed=1, now=None, cities=None, days=365):
+    """Insert venues, artists and shows with bulk INSERTs.
+
+    Venues and artists are spread over ``cities`` cities (default: CITIES),
+    shows over ``days`` days either side of ``now``. The same arguments (and
+    ``now``) always produce the same rows.
+    """
+    rng = random.Random(seed)
+    if now is None:
+        now = datetime.now()
+    genres = [genre for genre, _ in genre_choices]
+    places = CITIES if cities is None else city_list(cities)
+    locate = locator(random.Random('locations:%d' % seed))
+
+    db.session.execute(Venue.__table__.insert(), [dict({
+        'name': 'Venue %d' % i,
+        'address': '%d Main St' % i,
+        'city': city,
+        'state': state,
+        'phone': '123-123-1234',
+        'genres': rng.sample(genres, 2),
+        'seeking_talent': rng.random() < 0.5,
+    }, **locate(city, state)) for i, (city, state) in ((i, rng.choice(places)) for i in range(venues))])
+
+    db.session.execute(Artist.__table__.insert(), [{
+        'name': 'Artist %d' % i,
+        'city': city,
+        'state': state,
+        'phone': '123-123-1234',
+        'genres': rng.sample(genres, 2),
+        'seeking_venue': rng.random() < 0.5,
+    } for i, (city, state) in ((i, rng.choice(places)) for i in range(artists))])
+
+    venue_ids = [row[0] for row in db.session.query(Venue.id)]
+    artist_ids = [row[0] for row in db.session.query(Artist.id)]
+    if shows and venue_ids and artist_ids:
+        db.session.execute(Show.__table__.insert(), show_rows(rng, venue_ids, artist_ids, shows, now, days))
+    db.session.commit()
+    counters.recount(now)
+
+
+def locator(rng):
+    """A function giving each venue of a city coordinates within about ten
+    miles of the city's centre: its geocoded one, or a random point in the
+    continental US for made-up cities. Draws from its own ``rng`` so the
+    other seeded rows don't change with it."""
+    centres = {}
+
+    def locate(city, state):
+        if (city, state) not in centres:
+            centres[city, state] = geo.geocode(city, state) or (rng.uniform(25, 49), rng.uniform(-124, -67))
+        latitude, longitude = centres[city, state]
+        return {'latitude': latitude + rng.uniform(-0.1, 0.1), 'longitude': longitude + rng.uniform(-0.1, 0.1)}
+
+    return locate
+
+
+def show_rows(rng, venue_ids, artist_ids, count, now, days):
+    """One-hour shows on the hour, never double-booking an artist or a
+    venue; gives up on a show after a few clashing draws, so fewer than
+    ``count`` may come back when the calendars are nearly full."""
+    booked = set()
+    rows = []
+    for _ in range(count):
+        for _ in range(10):
+            venue_id, artist_id = rng.choice(venue_ids), rng.choice(artist_ids)
+            hour = rng.randint(-24 * days, 24 * days)
+            if ('venue', venue_id, hour) not in booked and ('artist', artist_id, hour) not in booked:
+                break
+        else:
+            continue
+        booked.update([('venue', venue_id, hour), ('artist', artist_id, hour)])
+        start_time = now + timedelta(hours=hour)
+        rows.append({
+            'venue_id': venue_id,
+            'artist_id': artist_id,
+            'start_time': start_time,
+            'end_time': start_time + timedelta(hours=1),
+        })
+    return rows
@@ -0,0 +1,94 @@
+"""Record validation before and after moving it into validation.py.
+
+    python -m benchmarks.validation [--count 1000000] [--invalid 0.1]
+
+The old checks are the ones VenueForm.validate used to run: the phone regex
+recompiled per call, the choice dicts rebuilt per call and a stop at the first
+error. The new engine is timed one record at a time, as a batch and column-wise
+over the same synthetic venues; all three must reject the same records.
+"""
+import argparse
+import random
+import re
+import time
+
+from validation import (VENUE_RULES, genre_choices, state_choices, validate,
+                        validate_batch, validate_columns)
+
+
+def old_is_valid_phone(number):
+    regex = re.compile(r'^\(?([0-9]{3})\)?[-. ]?([0-9]{3})[-. ]?([0-9]{4})$')
+    return regex.match(number)
+
+
+def old_validate(record):
+    for field in ('name', 'city', 'state', 'address', 'phone', 'genres'):
+        if not record[field]:
+            return False
+    if not old_is_valid_phone(record['phone']):
+        return False
+    if not set(record['genres']).issubset(dict(genre_choices).keys()):
+        return False
+    if record['state'] not in dict(state_choices).keys():
+        return False
+    return True
+
+
+def records(count, invalid, rng):
+    states = [state for state, _ in state_choices]
+    genres = [genre for genre, _ in genre_choices]
+    for id in range(count):
+        record = {
+            'name': 'Venue %d' % id,
+            'city': 'City %d' % (id % 100),
+            'state': rng.choice(states),
+            'address': '%d Main St' % id,
+            'phone': '%03d-%03d-%04d' % (rng.randrange(1000), rng.randrange(1000), rng.randrange(10000)),
+            'genres': rng.sample(genres, 2),
+            'facebook_link': 'https://www.facebook.com/venue%d' % id,
+        }
+        if rng.random() < invalid:
+            field = rng.choice(['phone', 'state', 'genres', 'name'])
+            record[field] = {'phone': 'not a phone', 'state': 'ZZ', 'genres': ['Polka'], 'name': ''}[field]
+        yield record
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=1000000)
+    parser.add_argument('--invalid', type=float, default=0.1, help='Share of records with an error.')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    data = list(records(args.count, args.invalid, random.Random(args.seed)))
+    columns = {field: [record[field] for record in data] for field in data[0]}
+    # the old checks had no URL rule
+    rules = {field: checks for field, checks in VENUE_RULES.items() if field != 'facebook_link'}
+
+    old, old_valid = timed(lambda: [old_validate(record) for record in data])
+    row, row_errors = timed(lambda: [validate(record, rules) for record in data])
+    batch, batch_errors = timed(validate_batch, data, rules)
+    column, column_errors = timed(validate_columns, columns, rules)
+
+    expected = {index for index, valid in enumerate(old_valid) if not valid}
+    assert {index for index, errors in enumerate(row_errors) if errors} == expected, 'row results differ'
+    assert {index for index, _ in batch_errors} == expected, 'batch results differ'
+    assert set(column_errors) == expected, 'column results differ'
+
+    print('%d records, %d invalid' % (args.count, len(expected)))
+    print('%-28s %10s %14s' % ('validator', 'total (s)', 'records/s'))
+    for name, seconds in [('old (form checks)', old),
+                          ('new, per record', row),
+                          ('new, batch', batch),
+                          ('new, columns', column)]:
+        print('%-28s %10.3f %14.0f' % (name, seconds, args.count / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Query count and latency of /venues as the venue table grows.
+
+    python -m benchmarks.venues [--database-url URL] [--scales 100,1000,5000]
+
+Defaults to an in-memory SQLite database. Point it at a scratch database only:
+tables are dropped and recreated for every scale.
+"""
+import argparse
+import time
+
+from sqlalchemy import event
+
+from app import app
+from cache import cache
+from models import db
+from benchmarks.seed import seed
+
+
+def measure(client, path, runs):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        timings = []
+        for _ in range(runs):
+            del statements[:]
+            start = time.perf_counter()
+            response = client.get(path)
+            timings.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.status_code
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    timings.sort()
+    return len(statements), timings[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-url', default='sqlite://')
+    parser.add_argument('--scales', default='100,1000,5000')
+    parser.add_argument('--shows-per-venue', type=int, default=10)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+    app.config['SQLALCHEMY_ECHO'] = False
+    # Time the directory query, not page cache hits
+    app.config['CACHE_TYPE'] = 'null'
+    cache.init_app(app)
+
+    print('%8s %8s %10s' % ('venues', 'queries', 'p50 (ms)'))
+    with app.app_context():
+        for scale in [int(n) for n in args.scales.split(',')]:
+            db.drop_all()
+            db.create_all()
+            seed(venues=scale, artists=max(scale // 10, 1), shows=scale * args.shows_per_venue)
+            queries, p50 = measure(app.test_client(), '/venues', args.runs)
+            print('%8d %8d %10.2f' % (scale, queries, p50 * 1000))
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
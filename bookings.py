@@ -0,0 +1,155 @@
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+from sqlalchemy import select
+
+from models import db, Venue, Artist, Show
+from validation import MAX_SHOW_MINUTES
+
+#----------------------------------------------------------------------------#
+# Bookings.
+#----------------------------------------------------------------------------#
+
+# A show books its artist and its venue for [start_time, end_time), and no two
+# bookings of either may overlap. booking_errors() checks new shows against
+# the stored ones and each other; on Postgres the ex_Show_*_booking exclusion
+# constraints (models.py) back it up for writes that skip the check.
+
+MAX_SHOW_DURATION = timedelta(minutes=MAX_SHOW_MINUTES)
+
+# Calendars a show is booked on: the field naming the owner, its model and
+# the Show column pointing at it.
+CALENDARS = {
+    'artist_id': (Artist, Show.artist_id),
+    'venue_id': (Venue, Show.venue_id),
+}
+
+
+class Schedule:
+    """The booked time of one artist or venue, as disjoint [start, end)
+    blocks sorted by start. Overlapping bookings (older data can have them)
+    are merged into one block, so checking or finding a slot is a binary
+    search."""
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.ids = []
+
+    def conflict(self, start, end):
+        """(start, end, show id) of a block overlapping [start, end), or None."""
+        index = bisect_left(self.starts, end) - 1
+        if index >= 0 and self.ends[index] > start:
+            return self.starts[index], self.ends[index], self.ids[index]
+        return None
+
+    def add(self, start, end, id=None):
+        if start >= end:
+            return
+        lo = bisect_right(self.ends, start)
+        hi = bisect_left(self.starts, end)
+        if lo < hi:
+            start = min(start, self.starts[lo])
+            end = max(end, self.ends[hi - 1])
+            id = self.ids[lo]
+        self.starts[lo:hi] = [start]
+        self.ends[lo:hi] = [end]
+        self.ids[lo:hi] = [id]
+
+    def free(self, start, end, min_length=timedelta(0)):
+        """Free [start, end) slots of at least ``min_length`` within the
+        window, in order."""
+        slots = []
+        cursor = start
+        for index in range(bisect_right(self.ends, start), bisect_left(self.starts, end)):
+            if self.starts[index] > cursor and self.starts[index] - cursor >= min_length:
+                slots.append((cursor, self.starts[index]))
+            cursor = max(cursor, self.ends[index])
+        if end > cursor and end - cursor >= min_length:
+            slots.append((cursor, end))
+        return slots
+
+
+def schedules(connection, field, ids, start, end):
+    """{id: Schedule} of the bookings overlapping [start, end) on the
+    ``field`` calendars of ``ids``.
+
+    No show lasts longer than MAX_SHOW_DURATION, so only shows starting in
+    (start - MAX_SHOW_DURATION, end) can overlap, and the lookup is one
+    range scan of the (owner, start_time) index per id.
+    """
+    _, key = CALENDARS[field]
+    calendars = {id: Schedule() for id in ids}
+    if not calendars:
+        return calendars
+    rows = connection.execute(
+        select(key, Show.start_time, Show.end_time, Show.id)
+        .where(key.in_(list(calendars)),
+               Show.start_time > start - MAX_SHOW_DURATION,
+               Show.start_time < end,
+               Show.end_time > start)
+        .order_by(Show.start_time)
+    )
+    for owner, show_start, show_end, id in rows:
+        calendars[owner].add(show_start, show_end, id)
+    return calendars
+
+
+def booking_errors(rows, lock=False):
+    """[(index, {field: [message]})] for the rows that can't be booked.
+
+    ``rows`` are dicts with artist_id, venue_id, start_time and end_time. A
+    row is refused if it lasts less than a minute or longer than
+    MAX_SHOW_DURATION, names an artist or venue that doesn't exist, or
+    overlaps a stored show or an earlier accepted row of the same artist or
+    venue. With ``lock`` the artist and venue rows are locked (on Postgres)
+    until the transaction ends, so concurrent bookings of them wait and see
+    this one.
+    """
+    invalid = {}
+    for index, row in enumerate(rows):
+        if not timedelta(minutes=1) <= row['end_time'] - row['start_time'] <= MAX_SHOW_DURATION:
+            invalid[index] = {'end_time': ['Shows last between 1 minute and %d hours.' % (MAX_SHOW_MINUTES // 60)]}
+    checked = [(index, row) for index, row in enumerate(rows) if index not in invalid]
+    if not checked:
+        return sorted(invalid.items())
+
+    connection = db.session.connection()
+    start = min(row['start_time'] for _, row in checked)
+    end = max(row['end_time'] for _, row in checked)
+    found = {}
+    calendars = {}
+    for field, (model, _) in CALENDARS.items():
+        query = select(model.id).where(model.id.in_({row[field] for _, row in checked})).order_by(model.id)
+        if lock:
+            query = query.with_for_update()
+        found[field] = {id for id, in connection.execute(query)}
+        calendars[field] = schedules(connection, field, found[field], start, end)
+
+    for index, row in checked:
+        errors = {}
+        for field in CALENDARS:
+            if row[field] not in found[field]:
+                errors[field] = ['Unknown id %d' % row[field]]
+                continue
+            booking = calendars[field][row[field]].conflict(row['start_time'], row['end_time'])
+            if booking is not None:
+                errors[field] = ['Already booked from %s to %s.' % (booking[0].strftime('%Y-%m-%d %H:%M'),
+                                                                   booking[1].strftime('%Y-%m-%d %H:%M'))]
+        if errors:
+            invalid[index] = errors
+            continue
+        for field in CALENDARS:
+            calendars[field][row[field]].add(row['start_time'], row['end_time'])
+    return sorted(invalid.items())
+
+
+def free_slots(field, id, start, end, min_length=timedelta(0)):
+    """Free slots of at least ``min_length`` in [start, end) on the artist's
+    (``field`` 'artist_id') or venue's ('venue_id') calendar, as (start, end)
+    pairs; None if there is no such artist or venue."""
+    model, _ = CALENDARS[field]
+    connection = db.session.connection()
+    if connection.execute(select(model.id).where(model.id == id)).scalar() is None:
+        return None
+    return schedules(connection, field, [id], start, end)[id].free(start, end, min_length)
@@ -0,0 +1,385 @@
+import csv
+import io
+import json
+import sys
+import time
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from itertools import islice
+
+import click
+from flask.cli import AppGroup
+
+from models import db, Venue, Artist, Show
+from cache import cache
+import bookings
+import counters
+import geo
+import jobs
+from validation import ARTIST_RULES, DEFAULT_SHOW_MINUTES, SHOW_RULES, VENUE_RULES, validate_batch
+
+#----------------------------------------------------------------------------#
+# Row conversion.
+#----------------------------------------------------------------------------#
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+TRUE = frozenset(['1', 'true', 't', 'yes', 'y', 'on'])
+
+
+def to_text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def to_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value or '').strip().lower() in TRUE
+
+
+def to_list(value):
+    if value is None or isinstance(value, list):
+        return value or []
+    return [item.strip() for item in str(value).split(',') if item.strip()]
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def to_datetime(value):
+    if isinstance(value, datetime) or value is None:
+        return value
+    value = str(value).strip()
+    for format in (DATETIME_FORMAT, '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M:%S.%f'):
+        try:
+            return datetime.strptime(value, format)
+        except ValueError:
+            pass
+    return value
+
+
+def default_location(index):
+    # latitude (0) or longitude (1) of the row's city, from geo.geocode()
+    def default(row):
+        location = geo.geocode(row['city'], row['state'])
+        return None if location is None else location[index]
+    return default
+
+
+def default_end_time(row):
+    if isinstance(row['start_time'], datetime):
+        return row['start_time'] + timedelta(minutes=DEFAULT_SHOW_MINUTES)
+
+
+class Entity:
+    """How one table is read, validated and written.
+
+    ``defaults`` maps fields to functions of the converted row filling them
+    in when the file leaves them empty.
+    """
+
+    def __init__(self, model, converters, rules, defaults=None):
+        self.model = model
+        self.converters = converters
+        self.rules = rules
+        self.defaults = defaults or {}
+        self.fields = ['id'] + list(converters)
+
+    def convert(self, raw, keep_ids):
+        row = {field: convert(raw.get(field)) for field, convert in self.converters.items()}
+        for field, default in self.defaults.items():
+            if row[field] in (None, ''):
+                row[field] = default(row)
+        if keep_ids:
+            row['id'] = to_int(raw.get('id'))
+        return row
+
+
+ENTITY_CONVERTERS = {
+    'name': to_text,
+    'city': to_text,
+    'state': to_text,
+    'phone': to_text,
+    'genres': to_list,
+    'image_link': to_text,
+    'facebook_link': to_text,
+    'website': to_text,
+    'seeking_description': to_text,
+}
+
+ENTITIES = {
+    'venues': Entity(Venue, dict(ENTITY_CONVERTERS, address=to_text, seeking_talent=to_bool,
+                                 latitude=to_float, longitude=to_float), VENUE_RULES,
+                     defaults={'latitude': default_location(0), 'longitude': default_location(1)}),
+    'artists': Entity(Artist, dict(ENTITY_CONVERTERS, seeking_venue=to_bool), ARTIST_RULES),
+    'shows': Entity(Show, {'artist_id': to_int, 'venue_id': to_int, 'start_time': to_datetime, 'end_time': to_datetime},
+                    SHOW_RULES, defaults={'end_time': default_end_time}),
+}
+
+#----------------------------------------------------------------------------#
+# Reading and writing files.
+#----------------------------------------------------------------------------#
+
+def open_stream(path, mode):
+    if path == '-':
+        return nullcontext(click.get_text_stream('stdin' if mode == 'r' else 'stdout'))
+    return open(path, mode, newline='', encoding='utf-8')
+
+
+def file_format(path, format):
+    if format:
+        return format
+    return 'jsonl' if path.endswith(('.jsonl', '.json')) else 'csv'
+
+
+def read_rows(stream, format):
+    """Yield (line number, raw dict, errors) from a CSV or JSONL stream;
+    errors is None, or {'row': [message]} for a JSONL line that isn't a
+    JSON object (raw is then None)."""
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for raw in reader:
+            yield reader.line_num, raw, None
+    else:
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                raw = json.loads(line)
+            except ValueError as e:
+                yield number, None, {'row': ['Not valid JSON: %s' % e]}
+                continue
+            if not isinstance(raw, dict):
+                yield number, None, {'row': ['Not a JSON object']}
+                continue
+            yield number, raw, None
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def csv_value(value):
+    if isinstance(value, list):
+        return ','.join(value)
+    if isinstance(value, datetime):
+        return value.strftime(DATETIME_FORMAT)
+    return value
+
+#----------------------------------------------------------------------------#
+# Bulk writes.
+#----------------------------------------------------------------------------#
+
+def pg_array(values):
+    return '{' + ','.join('"%s"' % value.replace('\\', '\\\\').replace('"', '\\"') for value in values) + '}'
+
+
+def copy_rows(table, columns, rows):
+    """Write rows with COPY ... FROM STDIN (Postgres only)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['\\N' if row[column] is None else
+                         pg_array(row[column]) if isinstance(row[column], list) else
+                         row[column] for column in columns])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert('COPY "%s" (%s) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')'
+                       % (table.name, ', '.join(columns)), buffer)
+
+
+def insert_rows(entity, rows, use_copy):
+    if use_copy:
+        table = entity.model.__table__
+        now = datetime.utcnow()
+        for row in rows:
+            row.setdefault('updated_at', now)
+        copy_rows(table, list(rows[0]), rows)
+    else:
+        db.session.execute(entity.model.__table__.insert(), rows)
+    if entity.model is Show:
+        counters.adjust(db.session.connection(),
+                        [(row['venue_id'], row['artist_id'], row['start_time']) for row in rows])
+
+
+def invalidate(entity, rows):
+    """Evict the cached pages the inserted rows appear on."""
+    if entity.model is Show:
+        tags = {'venues', 'shows'}
+        for row in rows:
+            tags.update(cache.show_tags(row['venue_id'], row['artist_id']))
+        cache.invalidate(*tags)
+    else:
+        cache.invalidate(entity.model.__tablename__.lower() + 's')
+
+
+def reset_sequence(entity):
+    if db.engine.dialect.name == 'postgresql':
+        table = entity.model.__table__.name
+        db.session.execute(db.text(
+            "SELECT setval(pg_get_serial_sequence('\"%s\"', 'id'), coalesce(max(id), 1)) FROM \"%s\""
+            % (table, table)))
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+fyyur_cli = AppGroup('fyyur', help='Bulk data management.')
+
+
+@fyyur_cli.command('import')
+@click.argument('entity', type=click.Choice(list(ENTITIES)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option('--format', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows validated and committed together.')
+@click.option('--keep-ids', is_flag=True, help='Insert the id column instead of generating ids.')
+@click.option('--copy/--no-copy', default=True, show_default=True, help='Use COPY on Postgres.')
+@click.option('--errors', type=click.File('w'), default='-', help='Where to report rejected rows (JSONL).')
+def import_command(entity, path, format, chunk_size, keep_ids, copy, errors):
+    """Import venues, artists or shows from a CSV or JSONL file.
+
+    Rows are validated with the same rules as the web forms; rejected rows
+    are reported with their line number and the rest are inserted in chunks.
+    """
+    entity = ENTITIES[entity]
+    use_copy = copy and db.engine.dialect.name == 'postgresql'
+    read = inserted = rejected = 0
+    start = time.perf_counter()
+
+    with open_stream(path, 'r') as stream:
+        for chunk in chunks(read_rows(stream, file_format(path, format)), chunk_size):
+            # unreadable lines are rejected like invalid rows; the others are checked by index in chunk
+            invalid = {index: unreadable for index, (_, _, unreadable) in enumerate(chunk) if unreadable}
+            readable = [index for index in range(len(chunk)) if index not in invalid]
+            rows = {index: entity.convert(chunk[index][1], keep_ids) for index in readable}
+            for position, row_errors in validate_batch([rows[index] for index in readable], entity.rules):
+                invalid[readable[position]] = row_errors
+            if keep_ids:
+                for index, row in rows.items():
+                    if not isinstance(row['id'], int):
+                        invalid.setdefault(index, {})['id'] = ['Not a valid integer value']
+            valid = []
+            for index, (line, _, _) in enumerate(chunk):
+                if index in invalid:
+                    rejected += 1
+                    errors.write(json.dumps({'line': line, 'errors': invalid[index]}) + '\n')
+                else:
+                    valid.append((line, rows[index]))
+
+            if entity.model is Show and valid:
+                # unknown artists/venues and double bookings, within the chunk too
+                refused = dict(bookings.booking_errors([row for _, row in valid], lock=True))
+                if refused:
+                    kept = []
+                    for index, (line, row) in enumerate(valid):
+                        if index in refused:
+                            rejected += 1
+                            errors.write(json.dumps({'line': line, 'errors': refused[index]}) + '\n')
+                        else:
+                            kept.append((line, row))
+                    valid = kept
+
+            read += len(chunk)
+            if valid:
+                try:
+                    insert_rows(entity, [row for _, row in valid], use_copy)
+                    db.session.commit()
+                    inserted += len(valid)
+                    invalidate(entity, [row for _, row in valid])
+                except Exception as e:
+                    db.session.rollback()
+                    rejected += len(valid)
+                    errors.write(json.dumps({'lines': [valid[0][0], valid[-1][0]], 'errors': str(e)}) + '\n')
+            else:
+                db.session.rollback()  # ends the chunk's transaction and its booking locks
+
+            elapsed = time.perf_counter() - start
+            click.echo('%d read, %d inserted, %d rejected (%.0f rows/s)'
+                       % (read, inserted, rejected, read / elapsed if elapsed else 0), err=True)
+
+    if keep_ids and inserted:
+        reset_sequence(entity)
+        db.session.commit()
+    if rejected:
+        sys.exit(1)
+
+
+@fyyur_cli.command('export')
+@click.argument('entity', type=click.Choice(list(ENTITIES)))
+@click.argument('path', type=click.Path(dir_okay=False, writable=True, allow_dash=True))
+@click.option('--format', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows fetched per round trip.')
+def export_command(entity, path, format, chunk_size):
+    """Export venues, artists or shows to a CSV or JSONL file."""
+    entity = ENTITIES[entity]
+    format = file_format(path, format)
+    columns = [getattr(entity.model, field) for field in entity.fields]
+    rows = db.session.query(*columns).order_by(entity.model.id) \
+        .execution_options(stream_results=True).yield_per(chunk_size)
+    written = 0
+    start = time.perf_counter()
+
+    with open_stream(path, 'w') as stream:
+        if format == 'csv':
+            writer = csv.writer(stream)
+            writer.writerow(entity.fields)
+        for row in rows:
+            if format == 'csv':
+                writer.writerow([csv_value(value) for value in row])
+            else:
+                stream.write(json.dumps(dict(zip(entity.fields, row)), default=csv_value) + '\n')
+            written += 1
+            if written % chunk_size == 0:
+                click.echo('%d written' % written, err=True)
+
+    elapsed = time.perf_counter() - start
+    click.echo('%d written (%.0f rows/s)' % (written, written / elapsed if elapsed else 0), err=True)
+
+
+@fyyur_cli.command('roll-shows')
+def roll_shows_command():
+    """Move shows that have started from the upcoming to the past counters.
+
+    Listings read these counters, so run this every minute or so (cron).
+    """
+    click.echo('%d shows moved to past' % counters.roll_forward(), err=True)
+
+
+@fyyur_cli.command('recount-shows')
+def recount_shows_command():
+    """Recompute every venue and artist show counter from the Show table."""
+    click.echo('%d shows counted' % counters.recount(), err=True)
+
+
+@fyyur_cli.command('work-jobs')
+@click.option('--workers', default=1, show_default=True, help='Jobs run at the same time.')
+@click.option('--burst', is_flag=True, help='Run the jobs that are due, then exit.')
+def work_jobs_command(workers, burst):
+    """Run background jobs (jobs.py) until stopped.
+
+    Outside development the web processes run no jobs (JOB_WORKERS=0), so
+    run this alongside them.
+    """
+    if burst:
+        click.echo('%d jobs run' % jobs.run_pending(), err=True)
+        return
+    jobs.queue.start(workers - 1)
+    jobs.queue.work()
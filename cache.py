@@ -0,0 +1,300 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, make_response, request, session
+
+from models import db, Show
+
+#----------------------------------------------------------------------------#
+# Backends.
+#----------------------------------------------------------------------------#
+
+class CacheStats:
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def as_dict(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+class NullCache:
+    """Caches nothing; used when CACHE_TYPE is 'null'."""
+
+    def __init__(self):
+        self.stats = CacheStats()
+
+    def get(self, key):
+        self.stats.misses += 1
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def version(self, tag):
+        return 0
+
+    def incr(self, tag):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class LRUCache:
+    """In-process cache bounded to ``max_size`` entries, each expiring after
+    ``ttl`` seconds. Least recently used entries are evicted first; tag
+    versions are kept apart so they are never evicted."""
+
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._data = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._data[key]
+                self.stats.evictions += 1
+                entry = None
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.stats.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.stats.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def version(self, tag):
+        return self._versions.get(tag, 0)
+
+    def incr(self, tag):
+        with self._lock:
+            self._versions[tag] = self._versions.get(tag, 0) + 1
+            return self._versions[tag]
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisCache:
+    """Cache stored in Redis, or anything with the same get/set/delete/incr
+    interface (FakeRedis below stands in for it locally). Tag versions are
+    stored without expiry."""
+
+    def __init__(self, client, prefix='fyyur:', ttl=300):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.stats = CacheStats()
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return pickle.loads(value)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=self.ttl if ttl is None else ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def version(self, tag):
+        value = self.client.get(self.prefix + 'tag:' + tag)
+        return 0 if value is None else int(value)
+
+    def incr(self, tag):
+        return self.client.incr(self.prefix + 'tag:' + tag)
+
+    def __len__(self):
+        return self.client.dbsize()
+
+
+class FakeRedis:
+    """The subset of the redis-py client RedisCache uses, kept in a dict."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is not None and entry[0] is not None and entry[0] < time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key)
+            return None if entry is None else entry[1]
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (None if ex is None else time.monotonic() + ex, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            entry = self._live(key)
+            value = int(entry[1]) + 1 if entry else 1
+            self._data[key] = (entry[0] if entry else None, str(value).encode())
+            return value
+
+    def dbsize(self):
+        return len(self._data)
+
+#----------------------------------------------------------------------------#
+# Cache.
+#----------------------------------------------------------------------------#
+
+class Cache:
+    """Tagged cache for view-model dicts and rendered pages.
+
+    Every entry belongs to one or more tags (e.g. 'venue:1', 'shows'), and the
+    tag versions are part of its key, so invalidating a tag is one counter
+    increment whichever backend is used.
+    """
+
+    def __init__(self, app=None):
+        self.backend = NullCache()
+        # whether every process sees the same entries (a real Redis server)
+        self.shared = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CACHE_TYPE', 'simple')
+        app.config.setdefault('CACHE_MAX_SIZE', 1024)
+        app.config.setdefault('CACHE_TTL', 300)
+        app.config.setdefault('CACHE_REDIS_URL', None)
+
+        cache_type = app.config['CACHE_TYPE']
+        self.shared = cache_type == 'redis' and app.config['CACHE_REDIS_URL'] is not None
+        if cache_type == 'simple':
+            self.backend = LRUCache(app.config['CACHE_MAX_SIZE'], app.config['CACHE_TTL'])
+        elif cache_type == 'redis':
+            url = app.config['CACHE_REDIS_URL']
+            if url is None:
+                client = FakeRedis()
+            else:
+                import redis
+                client = redis.Redis.from_url(url)
+            self.backend = RedisCache(client, ttl=app.config['CACHE_TTL'])
+        elif cache_type == 'null':
+            self.backend = NullCache()
+        else:
+            raise ValueError('unknown CACHE_TYPE %r' % cache_type)
+        app.extensions['cache'] = self
+
+    @property
+    def stats(self):
+        stats = self.backend.stats.as_dict()
+        stats['size'] = len(self.backend)
+        return stats
+
+    def _key(self, tags, name):
+        versions = ['%s@%d' % (tag, self.backend.version(tag)) for tag in tags]
+        return '|'.join(versions) + '|' + name
+
+    def get_or_set(self, tags, name, compute, ttl=None):
+        """Return the cached value for ``name`` under ``tags``, calling
+        ``compute()`` to fill it on a miss. ``ttl`` overrides CACHE_TTL."""
+        key = self._key(tags, name)
+        value = self.backend.get(key)
+        if value is None:
+            value = compute()
+            self.backend.set(key, value, ttl)
+        return value
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.backend.incr(tag)
+
+    def cached_page(self, tags):
+        """Cache the rendered response of a GET view.
+
+        ``tags`` is called with the view arguments and returns the tags the
+        page depends on. Requests with pending flash messages bypass the
+        cache, since the flashes are part of the page. Under @conditional the
+        page is also keyed on its ETag (g.page_etag), so a page is only ever
+        served under the ETag of the state it was rendered from, even when a
+        show has started or another process made the write.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                if session.get('_flashes'):
+                    return view(**kwargs)
+                key = self._key(tags(**kwargs), 'page:%s:%s' % (g.get('page_etag'), request.full_path))
+                page = self.backend.get(key)
+                if page is None:
+                    response = make_response(view(**kwargs))
+                    if response.status_code != 200 or response.is_streamed:
+                        return response
+                    page = (response.get_data(), response.mimetype)
+                    self.backend.set(key, page)
+                    response.headers['X-Cache'] = 'MISS'
+                    return response
+                response = current_app.response_class(page[0], mimetype=page[1])
+                response.headers['X-Cache'] = 'HIT'
+                return response
+            return wrapper
+        return decorator
+
+    #  Invalidation for the write paths
+    #  ----------------------------------------------------------------
+
+    def venue_tags(self, venue_id, created=False):
+        """Tags to invalidate when a venue is created, edited or deleted."""
+        if created:
+            return ['venues']
+        return ['venues', 'shows', 'venue:%d' % venue_id] + \
+            ['artist:%d' % id for id in self._show_partners(Show.venue_id, Show.artist_id, venue_id)]
+
+    def artist_tags(self, artist_id, created=False):
+        """Tags to invalidate when an artist is created, edited or deleted."""
+        if created:
+            return ['artists']
+        return ['artists', 'shows', 'artist:%d' % artist_id] + \
+            ['venue:%d' % id for id in self._show_partners(Show.artist_id, Show.venue_id, artist_id)]
+
+    def show_tags(self, venue_id, artist_id):
+        """Tags to invalidate when a show is booked or removed."""
+        return ['venues', 'shows', 'venue:%d' % venue_id, 'artist:%d' % artist_id]
+
+    def _show_partners(self, key, partner, id):
+        rows = db.session.query(partner).filter(key == id).distinct()
+        return [row[0] for row in rows]
+
+cache = Cache()
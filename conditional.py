@@ -0,0 +1,150 @@
+import hashlib
+from datetime import timezone
+from functools import wraps
+
+from flask import current_app, g, make_response, request, session
+from sqlalchemy import func, select
+
+from models import db, Venue, Artist, Show, ShowCounters
+from queries import request_now
+
+#----------------------------------------------------------------------------#
+# Conditional requests.
+#----------------------------------------------------------------------------#
+
+def conditional(version):
+    """Answer GET requests with 304 Not Modified when the page is unchanged.
+
+    ``version`` is called with the view arguments and returns the values the
+    page depends on (see the *_version functions below), or None when the
+    entity does not exist. It runs before the view, so a matching
+    If-None-Match or If-Modified-Since skips the queries and the rendering.
+    The ETag is left in g.page_etag for the view: a cached page has to be
+    keyed on it (see Cache.cached_page), or a body rendered from an older
+    state could go out under the current ETag and be revalidated forever.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            # g outlives the request when an app context was already pushed
+            g.page_state = g.page_etag = None
+            if session.get('_flashes'):
+                return view(**kwargs)
+            state = version(**kwargs)
+            if state is None:
+                return view(**kwargs)
+            etag, last_modified = make_etag(state), last_modified_at(state)
+            g.page_state, g.page_etag = state, etag
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                not_modified = request.if_modified_since is not None and last_modified is not None \
+                    and last_modified.replace(microsecond=0) <= request.if_modified_since
+            response = current_app.response_class(status=304) if not_modified else make_response(view(**kwargs))
+
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
+
+
+def page_version():
+    """ETag of the page being served, or None outside @conditional. Views
+    key the data they cache on it, so the data follows everything the page
+    depends on, including the moving split between past and upcoming shows
+    and writes made by other processes."""
+    return g.get('page_etag')
+
+
+def make_etag(state):
+    value = repr((current_app.config['ETAG_SALT'], state.values)).encode()
+    return hashlib.sha1(value).hexdigest()
+
+
+def last_modified_at(state):
+    """Latest change among ``state.modified``, as an aware UTC datetime.
+
+    updated_at columns are naive UTC; show start times are naive local time
+    (a show moving from upcoming to past changes the page too).
+    """
+    times = [time.replace(tzinfo=timezone.utc) for time in state.modified if time is not None]
+    times += [time.astimezone(timezone.utc) for time in state.started if time is not None]
+    return max(times) if times else None
+
+
+class PageState:
+
+    def __init__(self, values, modified, started=()):
+        self.values = values
+        self.modified = modified
+        self.started = started
+
+#----------------------------------------------------------------------------#
+# Page versions.
+#----------------------------------------------------------------------------#
+
+def show_aggregates(now, *criteria):
+    """Scalar subqueries describing the shows matching ``criteria``: how
+    many, the latest update, how many are upcoming and the latest past start.
+    Counts catch deletions, which leave no updated_at behind."""
+    def scalar(column, *extra):
+        return select(column).where(*(criteria + extra)).scalar_subquery()
+    return [
+        scalar(func.count(Show.id)),
+        scalar(func.max(Show.updated_at)),
+        scalar(func.count(Show.id), Show.start_time > now),
+        scalar(func.max(Show.start_time), Show.start_time <= now),
+    ]
+
+
+def table_aggregates(model):
+    return [
+        select(func.count(model.id)).scalar_subquery(),
+        select(func.max(model.updated_at)).scalar_subquery(),
+    ]
+
+
+def venues_version():
+    # The page shows the upcoming show counters, which change when shows are
+    # booked or removed and when counters.roll_forward() moves rolled_at.
+    rolled_at = select(ShowCounters.rolled_at).where(ShowCounters.id == 1).scalar_subquery()
+    row = db.session.query(*(table_aggregates(Venue) + table_aggregates(Show) + [rolled_at])).one()
+    return PageState(tuple(row), modified=[row[1], row[3]], started=[row[4]])
+
+
+def artists_version():
+    row = db.session.query(*table_aggregates(Artist)).one()
+    return PageState(tuple(row), modified=[row[1]])
+
+
+def shows_version():
+    now = request_now()
+    row = db.session.query(*(show_aggregates(now) + table_aggregates(Venue) + table_aggregates(Artist))).one()
+    values = tuple(row) + (request.args.get('after'),)
+    return PageState(values, modified=[row[1], row[5], row[7]], started=[row[3]])
+
+
+def venue_version(venue_id):
+    return entity_version(Venue, venue_id, Show.venue_id, Artist, Show.artist_id)
+
+
+def artist_version(artist_id):
+    return entity_version(Artist, artist_id, Show.artist_id, Venue, Show.venue_id)
+
+
+def entity_version(model, id, key, partner, partner_key):
+    """State of a venue/artist page: the entity row, its shows and the
+    updates of the partners named in them."""
+    now = request_now()
+    partners = select(func.max(partner.updated_at)) \
+        .where(partner.id.in_(select(partner_key).where(key == id))) \
+        .scalar_subquery()
+    updated_at = select(model.updated_at).where(model.id == id).scalar_subquery()
+    row = db.session.query(updated_at, partners, *show_aggregates(now, key == id)).one()
+    if row[0] is None:
+        return None
+    return PageState(tuple(row), modified=[row[0], row[1], row[3]], started=[row[5]])
@@ -0,0 +1,184 @@
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import bindparam, event, func, inspect, select
+
+from models import db, Venue, Artist, Show, ShowCounters
+from cache import cache
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# Venue.upcoming_shows_count / past_shows_count (and the Artist ones) split
+# each entity's shows at ShowCounters.rolled_at. Writes keep them in step in
+# the same transaction (the Show mapper events below, adjust() for bulk
+# inserts), and roll_forward() moves the shows that have started since
+# rolled_at from upcoming to past. Listings read the columns, so they can lag
+# by up to the roll-forward interval; the detail pages still split the shows
+# at the current time.
+
+# Show column linking each counted model to its shows.
+SHOW_KEYS = {
+    Venue: Show.venue_id,
+    Artist: Show.artist_id,
+}
+
+
+def rolled_at(connection, lock=None):
+    """The current split point, or None before the counters were set up.
+
+    ``lock`` is 'share' for writers that classify shows against it and
+    'update' for roll_forward()/recount(), which move it; on Postgres the two
+    wait for each other, so a show is never counted against a stale split.
+    """
+    query = select(ShowCounters.rolled_at).where(ShowCounters.id == 1)
+    if lock is not None:
+        query = query.with_for_update(read=lock == 'share')
+    return connection.execute(query).scalar()
+
+
+def apply(connection, model, deltas):
+    """Add {id: (upcoming, past)} to ``model``'s counters in one executemany.
+
+    updated_at is left alone: a count moving doesn't change the entity.
+    """
+    params = [{'_id': id, '_upcoming': upcoming, '_past': past}
+              for id, (upcoming, past) in deltas.items() if upcoming or past]
+    if not params:
+        return
+    table = model.__table__
+    statement = table.update().where(table.c.id == bindparam('_id')).values(
+        upcoming_shows_count=table.c.upcoming_shows_count + bindparam('_upcoming'),
+        past_shows_count=table.c.past_shows_count + bindparam('_past'),
+        updated_at=table.c.updated_at,
+    )
+    connection.execute(statement, params)
+
+
+def adjust(connection, shows, sign=1):
+    """Count shows in (``sign`` 1) or out (-1) of their venue's and artist's
+    counters. ``shows`` are (venue_id, artist_id, start_time) tuples; use this
+    for writes that bypass the ORM, such as bulk inserts and deletes."""
+    shows = list(shows)
+    if not shows:
+        return
+    split = rolled_at(connection, lock='share') or datetime.now()
+    deltas = {Venue: defaultdict(lambda: [0, 0]), Artist: defaultdict(lambda: [0, 0])}
+    for venue_id, artist_id, start_time in shows:
+        index = 0 if start_time > split else 1
+        deltas[Venue][venue_id][index] += sign
+        deltas[Artist][artist_id][index] += sign
+    for model, counts in deltas.items():
+        apply(connection, model, counts)
+
+
+def discount(connection, criteria):
+    """Count the shows matching ``criteria`` out of their venues' and
+    artists' counters, with one UPDATE per table however many shows match;
+    use it before deleting them in bulk (see archive.py)."""
+    split = rolled_at(connection, lock='share') or datetime.now()
+    for model, key in SHOW_KEYS.items():
+        table = model.__table__
+
+        def count(*extra):
+            return select(func.count(Show.id)).where(key == table.c.id, *criteria, *extra).scalar_subquery()
+
+        connection.execute(table.update().where(table.c.id.in_(select(key).where(*criteria))).values(
+            upcoming_shows_count=table.c.upcoming_shows_count - count(Show.start_time > split),
+            past_shows_count=table.c.past_shows_count - count(Show.start_time <= split),
+            updated_at=table.c.updated_at,
+        ))
+
+
+def roll_forward(now=None):
+    """Move the shows that started since the last run from upcoming to past,
+    commit, and return how many moved. Run it every minute or so."""
+    if now is None:
+        now = datetime.now()
+    connection = db.session.connection()
+    split = rolled_at(connection, lock='update')
+    if split is None:
+        recount(now)
+        return 0
+    if now <= split:
+        db.session.rollback()
+        return 0
+
+    started = connection.execute(
+        select(Show.venue_id, Show.artist_id).where(Show.start_time > split, Show.start_time <= now)
+    ).all()
+    for model, index in ((Venue, 0), (Artist, 1)):
+        deltas = defaultdict(lambda: [0, 0])
+        for row in started:
+            deltas[row[index]][0] -= 1
+            deltas[row[index]][1] += 1
+        apply(connection, model, deltas)
+    connection.execute(ShowCounters.__table__.update()
+                       .where(ShowCounters.__table__.c.id == 1).values(rolled_at=now))
+    db.session.commit()
+    if started:
+        cache.invalidate('venues')
+    return len(started)
+
+
+def recount(now=None):
+    """Recompute every counter from the Show table, split at ``now``, and
+    commit. Returns the number of shows counted."""
+    if now is None:
+        now = datetime.now()
+    connection = db.session.connection()
+    split = rolled_at(connection, lock='update')
+
+    for model, key in SHOW_KEYS.items():
+        table = model.__table__
+
+        def count(*criteria):
+            return select(func.count(Show.id)).where(key == table.c.id, *criteria).scalar_subquery()
+
+        connection.execute(table.update().values(
+            upcoming_shows_count=count(Show.start_time > now),
+            past_shows_count=count(Show.start_time <= now),
+            updated_at=table.c.updated_at,
+        ))
+    counters = ShowCounters.__table__
+    if split is None:
+        connection.execute(counters.insert().values(id=1, rolled_at=now))
+    else:
+        connection.execute(counters.update().where(counters.c.id == 1).values(rolled_at=now))
+    total = connection.execute(select(func.count(Show.id))).scalar()
+    db.session.commit()
+    cache.invalidate('venues')
+    return total
+
+#----------------------------------------------------------------------------#
+# ORM writes.
+#----------------------------------------------------------------------------#
+
+def _show_key(show, history=False):
+    if not history:
+        return show.venue_id, show.artist_id, show.start_time
+    state = inspect(show)
+
+    def before(name):
+        deleted = state.attrs[name].history.deleted
+        return deleted[0] if deleted else getattr(show, name)
+    return before('venue_id'), before('artist_id'), before('start_time')
+
+
+@event.listens_for(Show, 'after_insert')
+def _show_inserted(mapper, connection, show):
+    adjust(connection, [_show_key(show)], 1)
+
+
+@event.listens_for(Show, 'after_delete')
+def _show_deleted(mapper, connection, show):
+    adjust(connection, [_show_key(show, history=True)], -1)
+
+
+@event.listens_for(Show, 'after_update')
+def _show_updated(mapper, connection, show):
+    state = inspect(show)
+    if any(state.attrs[name].history.has_changes() for name in ('venue_id', 'artist_id', 'start_time')):
+        adjust(connection, [_show_key(show, history=True)], -1)
+        adjust(connection, [_show_key(show)], 1)
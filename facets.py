@@ -0,0 +1,224 @@
+import threading
+import time
+from collections import defaultdict
+
+from flask import current_app
+from sqlalchemy import String, and_, cast, func, literal, select, true, union_all
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from models import db, Venue, Artist
+from cache import cache
+
+#----------------------------------------------------------------------------#
+# Facets.
+#----------------------------------------------------------------------------#
+
+# Facets each model can be filtered and counted by. Selecting several values
+# of one facet matches any of them; filters on different facets all apply.
+FACETS = {
+    Venue: {
+        'genres': Venue.genres,
+        'city': Venue.city,
+        'state': Venue.state,
+        'seeking_talent': Venue.seeking_talent,
+    },
+    Artist: {
+        'genres': Artist.genres,
+        'city': Artist.city,
+        'state': Artist.state,
+        'seeking_venue': Artist.seeking_venue,
+    },
+}
+ARRAY_FACETS = frozenset(['genres'])
+BOOLEAN_FACETS = frozenset(['seeking_talent', 'seeking_venue'])
+
+# Cache tag of each model's listing, invalidated by its writes
+TAGS = {Venue: 'venues', Artist: 'artists'}
+
+
+def requested_filters(model, args):
+    """{facet: [values]} from request args (a MultiDict) such as
+    ?genres=Jazz&genres=Blues&state=CA&seeking_talent=true; other args
+    are ignored."""
+    filters = {}
+    for name in FACETS[model]:
+        values = [value for value in args.getlist(name) if value != '']
+        if name in BOOLEAN_FACETS:
+            values = [value.lower() in ('1', 'true', 'yes', 'on') for value in values]
+        if values:
+            filters[name] = sorted(set(values))
+    return filters
+
+
+def browse(model, filters, limit=None):
+    """``model`` rows matching ``filters`` plus the facet counts for the
+    sidebar:
+
+    {"count": n, "data": [{"id", "name", "num_upcoming_shows"}],
+     "facets": {facet: [{"value", "count", "selected"}]}}
+
+    Results are ordered by name. Each facet is counted with the filters on
+    the other facets applied, so its counts show what selecting a value
+    would add. Counts are cached for FACETS_TTL seconds.
+    """
+    if limit is None:
+        limit = current_app.config['SEARCH_LIMIT']
+    backend = get_backend()
+    count, data = backend.results(model, filters, limit)
+    key = 'facets:%s:%r' % (model.__tablename__, sorted(filters.items()))
+    counts = cache.get_or_set([TAGS[model]], key, lambda: backend.counts(model, filters),
+                              ttl=current_app.config['FACETS_TTL'])
+    return {"count": count, "data": data, "facets": facet_values(counts, filters)}
+
+
+def facet_values(counts, filters):
+    """The FACET_LIMIT most common values of each facet, most common first,
+    plus any selected value outside them."""
+    size = current_app.config['FACET_LIMIT']
+    facets = {}
+    for name, values in counts.items():
+        selected = set(filters.get(name, ()))
+        ranked = sorted(values.items(), key=lambda item: (-item[1], str(item[0])))
+        shown = ranked[:size] + [(value, values.get(value, 0)) for value in selected
+                                 if value not in dict(ranked[:size])]
+        facets[name] = [{"value": value, "count": count, "selected": value in selected}
+                        for value, count in shown]
+    return facets
+
+
+def get_backend():
+    name = current_app.config.get('FACETS_BACKEND')
+    if name is None:
+        name = 'postgres' if db.engine.dialect.name == 'postgresql' else 'memory'
+    return BACKENDS[name]
+
+
+class PostgresFacetBackend:
+    """Filters and counts in SQL. Genre filters are array overlaps (&&),
+    served by the GIN indexes on the genres columns; all facets are counted
+    in one UNION ALL of grouped queries, unnesting the genres."""
+
+    def conditions(self, model, filters, skip=None):
+        conditions = []
+        for name, values in filters.items():
+            column = FACETS[model][name]
+            if name == skip:
+                continue
+            if name in ARRAY_FACETS:
+                conditions.append(column.op('&&')(cast(values, ARRAY(String))))
+            else:
+                conditions.append(column.in_(values))
+        return and_(true(), *conditions)
+
+    def results(self, model, filters, limit):
+        rows = db.session.execute(
+            select(
+                model.id,
+                model.name,
+                model.upcoming_shows_count.label('num_upcoming_shows'),
+                func.count().over().label('total')
+            ).where(self.conditions(model, filters))
+            .order_by(model.name, model.id)
+            .limit(limit)
+        ).all()
+        count = rows[0].total if rows else 0
+        return count, [{"id": row.id, "name": row.name, "num_upcoming_shows": row.num_upcoming_shows}
+                       for row in rows]
+
+    def counts(self, model, filters):
+        queries = []
+        for name, column in FACETS[model].items():
+            if name in ARRAY_FACETS:
+                value = func.unnest(column).table_valued('value').render_derived()
+                query = select(literal(name), value.c.value, func.count()) \
+                    .select_from(model.__table__).join(value, true()).group_by(value.c.value)
+            else:
+                query = select(literal(name), cast(column, String), func.count()) \
+                    .where(column.isnot(None)).group_by(column)
+            queries.append(query.where(self.conditions(model, filters, skip=name)))
+
+        counts = {name: {} for name in FACETS[model]}
+        for name, value, count in db.session.execute(union_all(*queries)):
+            if name in BOOLEAN_FACETS:
+                value = value == 'true'
+            counts[name][value] = count
+        return counts
+
+
+class InvertedIndex:
+    """{facet: {value: ids}} over every row of a model, plus the rows' sort
+    keys, for filtering and counting without SQL."""
+
+    def __init__(self, model):
+        columns = FACETS[model]
+        self.postings = {name: defaultdict(set) for name in columns}
+        self.names = {}
+        for row in db.session.query(model.id, model.name, *columns.values()):
+            self.names[row.id] = (row.name or '', row.id)
+            for name in columns:
+                value = getattr(row, name)
+                if name in ARRAY_FACETS:
+                    items = value or ()
+                else:
+                    items = () if value is None else (value,)
+                for item in items:
+                    self.postings[name][item].add(row.id)
+
+    def matching(self, filters, skip=None):
+        ids = set(self.names)
+        for name, values in filters.items():
+            if name != skip:
+                postings = self.postings[name]
+                ids.intersection_update(set().union(*(postings.get(value, ()) for value in values)))
+        return ids
+
+    def counts(self, filters):
+        counts = {}
+        for name, postings in self.postings.items():
+            ids = self.matching(filters, skip=name)
+            counts[name] = {}
+            for value, members in postings.items():
+                count = len(members & ids)
+                if count:
+                    counts[name][value] = count
+        return counts
+
+
+class InMemoryFacetBackend:
+    """Filters and counts with an InvertedIndex per model, for SQLite and
+    tests. An index is rebuilt when the model's cache tag is invalidated or
+    after FACETS_TTL seconds, whichever comes first."""
+
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def index(self, model):
+        version = cache.backend.version(TAGS[model])
+        with self._lock:
+            entry = self._indexes.get(model)
+            if entry is None or entry[0] != version or entry[1] < time.monotonic():
+                entry = (version, time.monotonic() + current_app.config['FACETS_TTL'], InvertedIndex(model))
+                self._indexes[model] = entry
+            return entry[2]
+
+    def results(self, model, filters, limit):
+        index = self.index(model)
+        ids = sorted(index.matching(filters), key=index.names.__getitem__)
+        page = ids[:limit]
+        rows = {row.id: row for row in db.session.query(
+            model.id, model.name, model.upcoming_shows_count).filter(model.id.in_(page))}
+        return len(ids), [{
+            "id": id,
+            "name": rows[id].name,
+            "num_upcoming_shows": rows[id].upcoming_shows_count
+        } for id in page if id in rows]
+
+    def counts(self, model, filters):
+        return self.index(model).counts(filters)
+
+
+BACKENDS = {
+    'postgres': PostgresFacetBackend(),
+    'memory': InMemoryFacetBackend(),
+}
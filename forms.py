@@ -1,8 +1,19 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+import wtforms
 from flask_wtf import FlaskForm as Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL, ValidationError
-import re
+from wtforms import (
+    StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, IntegerField, FieldList, FormField
+)
+from wtforms.validators import DataRequired, AnyOf, InputRequired, Optional, URL, NumberRange, ValidationError
+from validation import (
+    PHONE,
+    DEFAULT_SHOW_MINUTES,
+    ENTITY_FORM_RULES,
+    MAX_SHOW_MINUTES,
+    genre_choices,
+    state_choices,
+    validate
+)
 
 def is_valid_phone(number):
     """ Validate phone numbers like:
@@ -18,98 +29,67 @@ def is_valid_phone(number):
 
     Note: (? = optional) - Learn more: https://regex101.com/
     """
-    regex = re.compile('^\(?([0-9]{3})\)?[-. ]?([0-9]{3})[-. ]?([0-9]{4})$')
-    return regex.match(number)
-
-
-state_choices = [
-    ('AL', 'AL'),
-    ('AK', 'AK'),
-    ('AZ', 'AZ'),
-    ('AR', 'AR'),
-    ('CA', 'CA'),
-    ('CO', 'CO'),
-    ('CT', 'CT'),
-    ('DE', 'DE'),
-    ('DC', 'DC'),
-    ('FL', 'FL'),
-    ('GA', 'GA'),
-    ('HI', 'HI'),
-    ('ID', 'ID'),
-    ('IL', 'IL'),
-    ('IN', 'IN'),
-    ('IA', 'IA'),
-    ('KS', 'KS'),
-    ('KY', 'KY'),
-    ('LA', 'LA'),
-    ('ME', 'ME'),
-    ('MT', 'MT'),
-    ('NE', 'NE'),
-    ('NV', 'NV'),
-    ('NH', 'NH'),
-    ('NJ', 'NJ'),
-    ('NM', 'NM'),
-    ('NY', 'NY'),
-    ('NC', 'NC'),
-    ('ND', 'ND'),
-    ('OH', 'OH'),
-    ('OK', 'OK'),
-    ('OR', 'OR'),
-    ('MD', 'MD'),
-    ('MA', 'MA'),
-    ('MI', 'MI'),
-    ('MN', 'MN'),
-    ('MS', 'MS'),
-    ('MO', 'MO'),
-    ('PA', 'PA'),
-    ('RI', 'RI'),
-    ('SC', 'SC'),
-    ('SD', 'SD'),
-    ('TN', 'TN'),
-    ('TX', 'TX'),
-    ('UT', 'UT'),
-    ('VT', 'VT'),
-    ('VA', 'VA'),
-    ('WA', 'WA'),
-    ('WV', 'WV'),
-    ('WI', 'WI'),
-    ('WY', 'WY')
-]
-
-genre_choices = [
-    ('Alternative', 'Alternative'),
-    ('Blues', 'Blues'),
-    ('Classical', 'Classical'),
-    ('Country', 'Country'),
-    ('Electronic', 'Electronic'),
-    ('Folk', 'Folk'),
-    ('Funk', 'Funk'),
-    ('Hip-Hop', 'Hip-Hop'),
-    ('Heavy Metal', 'Heavy Metal'),
-    ('Instrumental', 'Instrumental'),
-    ('Jazz', 'Jazz'),
-    ('Musical Theatre', 'Musical Theatre'),
-    ('Pop', 'Pop'),
-    ('Punk', 'Punk'),
-    ('R&B', 'R&B'),
-    ('Reggae', 'Reggae'),
-    ('Rock n Roll', 'Rock n Roll'),
-    ('Soul', 'Soul'),
-    ('Other', 'Other'),
-]
+    return PHONE.match(number)
+
+
+# Show rows on the new venue form
+FIRST_SHOWS = 3
+
+
+def form_field(form, name):
+    """The field called ``name``, including the fields of FieldList
+    entries, which are named like their inputs (shows-0-artist_id)."""
+    if name in form:
+        return form[name]
+    for field in form:
+        if isinstance(field, FieldList):
+            for entry in field:
+                if name.startswith(entry.name + '-'):
+                    return form_field(entry.form, name[len(entry.name) + 1:])
+    raise KeyError(name)
+
+
+def add_errors(form, errors):
+    """Append validation.validate() errors to fields WTForms passed."""
+    valid = True
+    for name, messages in errors.items():
+        field = form_field(form, name)
+        if not field.errors:
+            field.errors.extend(messages)
+            valid = False
+    return valid
+
+
+def error_messages(form):
+    """'field message|message' for each field with errors, FieldList
+    entries included."""
+    messages = []
+    for field in form:
+        if isinstance(field, FieldList):
+            for entry in field:
+                messages.extend(error_messages(entry.form))
+        elif field.errors:
+            messages.append(field.name + ' ' + '|'.join(field.errors))
+    return messages
 
 class ShowForm(Form):
-    artist_id = StringField(
-        'artist_id'
+    artist_id = IntegerField(
+        'artist_id', validators=[InputRequired()]
     )
-    venue_id = StringField(
-        'venue_id'
+    venue_id = IntegerField(
+        'venue_id', validators=[InputRequired()]
     )
     start_time = DateTimeField(
         'start_time',
         validators=[DataRequired()],
         default= datetime.today()
     )
+    duration = IntegerField(
+        # minutes
+        'duration',
+        validators=[NumberRange(min=1, max=MAX_SHOW_MINUTES)],
+        default=DEFAULT_SHOW_MINUTES
+    )
 
 class VenueForm(Form):
     name = StringField(
@@ -152,20 +132,48 @@ class VenueForm(Form):
     def validate(self):
         """Define a custom validate method in your Form:"""
         rv = Form.validate(self)
-        if not rv:
-            return False
-        if not is_valid_phone(self.phone.data):
-            self.phone.errors.append('Invalid phone.')
-            return False
-        if not set(self.genres.data).issubset(dict(genre_choices).keys()):
-            self.genres.errors.append('Invalid genres.')
-            return False
-        if self.state.data not in dict(state_choices).keys():
-            self.state.errors.append('Invalid state.')
-            return False
-        # if pass validation
-        return True
+        # report every failing field at once
+        return add_errors(self, validate(self.data, ENTITY_FORM_RULES)) and rv
+
+
+class FirstShowForm(wtforms.Form):
+    # one optional row of the shows booked along with a new venue
+    artist_id = IntegerField(
+        'artist_id', validators=[Optional()]
+    )
+    start_time = DateTimeField(
+        'start_time', validators=[Optional()]
+    )
+    duration = IntegerField(
+        # minutes
+        'duration',
+        validators=[Optional(), NumberRange(min=1, max=MAX_SHOW_MINUTES)],
+        default=DEFAULT_SHOW_MINUTES
+    )
 
+    def validate(self):
+        rv = wtforms.Form.validate(self)
+        # an artist and a start time, or neither
+        for field, other in ((self.artist_id, self.start_time), (self.start_time, self.artist_id)):
+            if field.data is None and not field.errors and other.data is not None:
+                field.errors.append('This field is required.')
+                rv = False
+        return rv
+
+class NewVenueForm(VenueForm):
+    shows = FieldList(FormField(FirstShowForm), min_entries=FIRST_SHOWS, max_entries=FIRST_SHOWS)
+
+    def first_shows(self):
+        """{entry name: show} for the filled in show rows, as
+        writes.create_venue() takes them."""
+        shows = {}
+        for entry in self.shows:
+            if entry.artist_id.data is not None:
+                start_time = entry.start_time.data
+                minutes = entry.duration.data or DEFAULT_SHOW_MINUTES
+                shows[entry.name] = {'artist_id': entry.artist_id.data, 'start_time': start_time,
+                                     'end_time': start_time + timedelta(minutes=minutes)}
+        return shows
 
 
 class ArtistForm(Form):
@@ -208,17 +216,6 @@ class ArtistForm(Form):
     def validate(self):
         """Define a custom validate method in your Form:"""
         rv = Form.validate(self)
-        if not rv:
-            return False
-        if not is_valid_phone(self.phone.data):
-            self.phone.errors.append('Invalid phone.')
-            return False
-        if not set(self.genres.data).issubset(dict(genre_choices).keys()):
-            self.genres.errors.append('Invalid genres.')
-            return False
-        if self.state.data not in dict(state_choices).keys():
-            self.state.errors.append('Invalid state.')
-            return False
-        # if pass validation
-        return True
+        # report every failing field at once
+        return add_errors(self, validate(self.data, ENTITY_FORM_RULES)) and rv
 
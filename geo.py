@@ -0,0 +1,262 @@
+import csv
+import heapq
+import math
+import os
+import threading
+import time
+from functools import lru_cache
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from models import db, Venue
+from cache import cache
+
+#----------------------------------------------------------------------------#
+# Geocoding.
+#----------------------------------------------------------------------------#
+
+# US cities with their coordinates, bundled so geocoding needs no network
+CITIES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'cities.csv')
+
+# The sphere earthdistance's earth() uses, so both backends agree on distances
+EARTH_RADIUS_MILES = 6378168 / 1609.344
+METERS_PER_MILE = 1609.344
+
+ABBREVIATIONS = {'st': 'saint', 'ste': 'sainte', 'ft': 'fort', 'mt': 'mount'}
+
+
+def city_key(city, state):
+    """Lookup key for a city, ignoring case, dots and abbreviated prefixes:
+    "St. Louis", "saint louis" and "ST LOUIS" are the same city."""
+    words = (city or '').replace('.', ' ').lower().split()
+    if words:
+        words[0] = ABBREVIATIONS.get(words[0], words[0])
+    return ' '.join(words), (state or '').strip().upper()
+
+
+@lru_cache(maxsize=None)
+def city_table():
+    with open(CITIES_FILE, newline='') as file:
+        return {city_key(row['city'], row['state']): (float(row['latitude']), float(row['longitude']))
+                for row in csv.DictReader(file)}
+
+
+def geocode(city, state):
+    """(latitude, longitude) of a city from the bundled table, or None if
+    it isn't listed."""
+    return city_table().get(city_key(city, state))
+
+
+def unit_vector(latitude, longitude):
+    """The point on the unit sphere, so straight-line (chord) distances
+    between points order the same way as distances along the surface."""
+    lat, lon = math.radians(latitude), math.radians(longitude)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+def chord_to_miles(chord):
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(chord / 2, 1.0))
+
+
+def miles_to_chord(miles):
+    return 2 * math.sin(min(miles / EARTH_RADIUS_MILES, math.pi) / 2)
+
+
+def distance_miles(origin, point):
+    """Great-circle distance between two (latitude, longitude) pairs."""
+    return chord_to_miles(math.dist(unit_vector(*origin), unit_vector(*point)))
+
+#----------------------------------------------------------------------------#
+# Nearby venues.
+#----------------------------------------------------------------------------#
+
+def venues_near(latitude, longitude, miles=None, limit=None, seeking_talent=None):
+    """Venues with coordinates nearest (latitude, longitude), nearest first:
+
+    [{"id", "name", "city", "state", "seeking_talent", "num_upcoming_shows",
+      "distance_miles"}]
+
+    At most ``limit`` venues (default SEARCH_LIMIT) are returned, only those
+    within ``miles`` if given, and only those whose seeking_talent matches
+    if it isn't None.
+    """
+    if limit is None:
+        limit = current_app.config['SEARCH_LIMIT']
+    return get_backend().near((latitude, longitude), miles, limit, seeking_talent)
+
+
+def requested_search(args):
+    """venues_near() arguments from request args (a MultiDict): the place
+    as ?lat=..&lon=.. or ?city=..&state=.., plus optional ?miles= and
+    ?seeking_talent=. Raises ValueError with a message for the user when
+    they don't add up to a known place."""
+    try:
+        if args.get('lat') or args.get('lon'):
+            latitude, longitude = float(args.get('lat', '')), float(args.get('lon', ''))
+            if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                raise ValueError
+        else:
+            latitude = longitude = None
+        miles = float(args['miles']) if args.get('miles') else None
+    except ValueError:
+        raise ValueError('lat, lon and miles must be numbers, lat within ±90 and lon within ±180')
+    if miles is not None and miles <= 0:
+        raise ValueError('miles must be positive')
+    if latitude is None:
+        if not args.get('city'):
+            raise ValueError('give a place as lat and lon, or city and state')
+        location = geocode(args.get('city'), args.get('state'))
+        if location is None:
+            raise ValueError('unknown city %s, %s' % (args.get('city'), args.get('state', '')))
+        latitude, longitude = location
+    seeking_talent = args.get('seeking_talent')
+    if seeking_talent:
+        seeking_talent = seeking_talent.lower() in ('1', 'true', 'yes', 'on')
+    else:
+        seeking_talent = None
+    return {'latitude': latitude, 'longitude': longitude, 'miles': miles, 'seeking_talent': seeking_talent}
+
+
+def get_backend():
+    name = current_app.config.get('GEO_BACKEND')
+    if name is None:
+        name = 'postgres' if db.engine.dialect.name == 'postgresql' else 'memory'
+    return BACKENDS[name]
+
+
+def near_result(row, miles):
+    return {
+        "id": row.id,
+        "name": row.name,
+        "city": row.city,
+        "state": row.state,
+        "seeking_talent": bool(row.seeking_talent),
+        "num_upcoming_shows": row.upcoming_shows_count,
+        "distance_miles": round(miles, 1),
+    }
+
+
+class PostgresGeoBackend:
+    """Radius and nearest-neighbour queries with the earthdistance
+    extension, served by the GiST index on ll_to_earth(latitude, longitude)
+    (ix_Venue_earth, see models.py). earth_box() narrows a radius search to
+    the index's bounding cube before the exact distance check, and ordering
+    by the cube <-> operator walks the index nearest first."""
+
+    def near(self, origin, miles, limit, seeking_talent):
+        here = func.ll_to_earth(*origin)
+        point = func.ll_to_earth(Venue.latitude, Venue.longitude)
+        distance = func.earth_distance(here, point)
+        query = select(
+            Venue.id, Venue.name, Venue.city, Venue.state, Venue.seeking_talent,
+            Venue.upcoming_shows_count, distance.label('meters')
+        ).where(Venue.latitude.isnot(None), Venue.longitude.isnot(None)) \
+            .order_by(point.op('<->')(here)) \
+            .limit(limit)
+        if miles is not None:
+            meters = miles * METERS_PER_MILE
+            query = query.where(func.earth_box(here, meters).op('@>')(point), distance <= meters)
+        if seeking_talent is not None:
+            query = query.where(Venue.seeking_talent.is_(seeking_talent))
+        return [near_result(row, row.meters / METERS_PER_MILE) for row in db.session.execute(query)]
+
+
+class KDTree:
+    """Static 3-d tree over (id, unit vector) points. A nearest search only
+    descends into the far side of a split when the splitting plane is closer
+    than the current k-th best (or the radius), so it visits O(log n) nodes
+    for a well spread set of points."""
+
+    def __init__(self, points):
+        self.root = self._build(list(points), 0)
+
+    def _build(self, points, axis):
+        if not points:
+            return None
+        points.sort(key=lambda point: point[1][axis])
+        middle = len(points) // 2
+        id, vector = points[middle]
+        following = (axis + 1) % 3
+        return (id, vector, axis,
+                self._build(points[:middle], following), self._build(points[middle + 1:], following))
+
+    def nearest(self, target, k, max_distance=math.inf, accept=None):
+        """[(distance, id)] of the ``k`` points nearest ``target`` within
+        ``max_distance`` (straight-line) that ``accept(id)`` allows, nearest
+        first."""
+        best = []  # max-heap of (-distance, -id)
+
+        def bound():
+            return -best[0][0] if len(best) == k else max_distance
+
+        def visit(node):
+            if node is None:
+                return
+            id, vector, axis, left, right = node
+            offset = target[axis] - vector[axis]
+            near, far = (left, right) if offset < 0 else (right, left)
+            visit(near)
+            distance = math.dist(target, vector)
+            if distance <= bound() and (accept is None or accept(id)):
+                heapq.heappush(best, (-distance, -id))
+                if len(best) > k:
+                    heapq.heappop(best)
+            if abs(offset) <= bound():
+                visit(far)
+
+        if k > 0:
+            visit(self.root)
+        return sorted((-distance, -id) for distance, id in best)
+
+
+class VenueLocations:
+    """A KDTree over every venue with coordinates, plus each one's
+    seeking_talent flag for filtering during the search."""
+
+    def __init__(self):
+        rows = db.session.query(Venue.id, Venue.latitude, Venue.longitude, Venue.seeking_talent) \
+            .filter(Venue.latitude.isnot(None), Venue.longitude.isnot(None))
+        self.seeking = {}
+        points = []
+        for row in rows:
+            self.seeking[row.id] = bool(row.seeking_talent)
+            points.append((row.id, unit_vector(row.latitude, row.longitude)))
+        self.tree = KDTree(points)
+
+
+class InMemoryGeoBackend:
+    """Nearest-neighbour queries on a VenueLocations KD-tree, for SQLite and
+    tests. The tree is rebuilt when the venues cache tag is invalidated or
+    after GEO_INDEX_TTL seconds, whichever comes first."""
+
+    def __init__(self):
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def locations(self):
+        version = cache.backend.version('venues')
+        with self._lock:
+            entry = self._entry
+            if entry is None or entry[0] != version or entry[1] < time.monotonic():
+                entry = (version, time.monotonic() + current_app.config['GEO_INDEX_TTL'], VenueLocations())
+                self._entry = entry
+            return entry[2]
+
+    def near(self, origin, miles, limit, seeking_talent):
+        locations = self.locations()
+        accept = None
+        if seeking_talent is not None:
+            accept = lambda id: locations.seeking[id] == seeking_talent
+        max_distance = math.inf if miles is None else miles_to_chord(miles)
+        found = locations.tree.nearest(unit_vector(*origin), limit, max_distance, accept)
+        rows = {row.id: row for row in db.session.query(
+            Venue.id, Venue.name, Venue.city, Venue.state, Venue.seeking_talent,
+            Venue.upcoming_shows_count).filter(Venue.id.in_([id for _, id in found]))}
+        return [near_result(rows[id], chord_to_miles(distance)) for distance, id in found if id in rows]
+
+
+BACKENDS = {
+    'postgres': PostgresGeoBackend(),
+    'memory': InMemoryGeoBackend(),
+}
@@ -0,0 +1,70 @@
+import time
+
+from flask import Blueprint, current_app, jsonify
+
+from models import db
+import instrumentation
+import jobs
+
+health = Blueprint('health', __name__)
+
+#----------------------------------------------------------------------------#
+# Connection pool.
+#----------------------------------------------------------------------------#
+
+def pool_status():
+    """Size and usage of the engine's connection pool.
+
+    ``checked_out`` connections are in use by requests, ``overflow`` is how
+    many were opened beyond ``size`` (negative while the pool is still filling
+    up). SQLite pools only report what they have.
+    """
+    pool = db.engine.pool
+    status = {'class': type(pool).__name__}
+    for name, method in (('size', 'size'), ('checked_in', 'checkedin'),
+                         ('checked_out', 'checkedout'), ('overflow', 'overflow')):
+        if hasattr(pool, method):
+            status[name] = getattr(pool, method)()
+    max_overflow = getattr(pool, '_max_overflow', None)
+    if max_overflow is not None and 'size' in status:
+        status['max_overflow'] = max_overflow
+        status['capacity'] = status['size'] + max(max_overflow, 0)
+    return status
+
+#----------------------------------------------------------------------------#
+# Endpoints.
+#----------------------------------------------------------------------------#
+
+@health.route('/healthz')
+def healthz():
+    """200 when a database round trip works, 503 otherwise."""
+    start = time.perf_counter()
+    try:
+        db.session.execute(db.text('SELECT 1'))
+        database = 'ok'
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning('health check failed: %s', e)
+        database = 'unavailable'
+    body = {
+        'status': 'ok' if database == 'ok' else 'error',
+        'database': database,
+        'database_ms': round((time.perf_counter() - start) * 1000, 2),
+        'pool': pool_status(),
+    }
+    return jsonify(body), 200 if database == 'ok' else 503
+
+
+@health.route('/metrics')
+def metrics():
+    """Pool gauges, the per-endpoint request histograms (see
+    instrumentation.py) and the job queue's depth and throughput (see
+    jobs.py) in the Prometheus text format."""
+    lines = []
+    for name, value in pool_status().items():
+        if name == 'class':
+            continue
+        metric = 'fyyur_db_pool_' + name
+        lines += ['# TYPE %s gauge' % metric, '%s %d' % (metric, value)]
+    body = '\n'.join(lines) + '\n' + instrumentation.render_metrics() + jobs.render_metrics()
+    return current_app.response_class(body, mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,251 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import g, has_app_context, request
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from models import db
+
+#----------------------------------------------------------------------------#
+# Rows hydrated per request.
+#----------------------------------------------------------------------------#
+
+def _count_hydrated(target, context):
+    if has_app_context():
+        g.rows_hydrated = g.get('rows_hydrated', 0) + 1
+
+#----------------------------------------------------------------------------#
+# Statements and templates per request.
+#----------------------------------------------------------------------------#
+
+# The start time is kept on the statement's execution context, which is
+# dropped with it, so a statement that fails leaves nothing behind on the
+# pooled connection.
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._fyyur_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._fyyur_start
+    if has_app_context():
+        g.statements = g.get('statements', 0) + 1
+        g.db_time = g.get('db_time', 0.0) + elapsed
+
+
+def _add_template_time(start):
+    if has_app_context():
+        g.template_time = g.get('template_time', 0.0) + time.perf_counter() - start
+
+
+class TimedTemplate(Template):
+    """Jinja template adding its render time to the current request, whether
+    it is rendered whole or streamed (stream() consumes generate())."""
+
+    def render(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            _add_template_time(start)
+
+    def generate(self, *args, **kwargs):
+        chunks = super().generate(*args, **kwargs)
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            finally:
+                _add_template_time(start)
+            yield chunk
+
+
+def request_stats(state=None):
+    """What the current request has cost so far; ``state`` is the request's
+    g, for reading it after the request context is gone."""
+    state = g if state is None else state
+    return {
+        'statements': state.get('statements', 0),
+        'db_time': state.get('db_time', 0.0),
+        'template_time': state.get('template_time', 0.0),
+        'rows_hydrated': state.get('rows_hydrated', 0),
+    }
+
+
+@contextmanager
+def assert_max_queries(count, engine=None):
+    """Fail with AssertionError when the block runs more than ``count`` SQL
+    statements; the statements are listed in the message.
+
+        with assert_max_queries(3):
+            client.get('/venues/1')
+    """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = engine or db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    if len(statements) > count:
+        raise AssertionError('%d queries executed, expected at most %d:\n%s'
+                             % (len(statements), count, '\n'.join(statements)))
+
+#----------------------------------------------------------------------------#
+# Prometheus histograms.
+#----------------------------------------------------------------------------#
+
+class Histogram:
+    """Cumulative histogram per endpoint (or other ``label``), rendered in
+    the Prometheus text format (each ``le`` bucket counts observations up to
+    that bound)."""
+
+    def __init__(self, name, help, buckets, label='endpoint'):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.label = label
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, value):
+        with self._lock:
+            entry = self._values.get(endpoint)
+            if entry is None:
+                entry = self._values[endpoint] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        with self._lock:
+            values = sorted((endpoint, list(counts), total, count)
+                            for endpoint, (counts, total, count) in self._values.items())
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s histogram' % self.name]
+        for endpoint, counts, total, count in values:
+            cumulative = 0
+            for bound, observed in zip(self.buckets, counts):
+                cumulative += observed
+                lines.append('%s_bucket{%s="%s",le="%s"} %d' % (self.name, self.label, endpoint, bound, cumulative))
+            lines.append('%s_bucket{%s="%s",le="+Inf"} %d' % (self.name, self.label, endpoint, count))
+            lines.append('%s_sum{%s="%s"} %r' % (self.name, self.label, endpoint, total))
+            lines.append('%s_count{%s="%s"} %d' % (self.name, self.label, endpoint, count))
+        return '\n'.join(lines)
+
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+HISTOGRAMS = {
+    'duration': Histogram('fyyur_request_duration_seconds', 'Request latency.', SECONDS),
+    'db_time': Histogram('fyyur_request_db_seconds', 'Time spent in SQL statements per request.', SECONDS),
+    'statements': Histogram('fyyur_request_statements', 'SQL statements per request.',
+                            (1, 2, 3, 5, 10, 20, 50, 100)),
+    'template_time': Histogram('fyyur_request_template_seconds', 'Template render time per request.', SECONDS),
+    'rows_hydrated': Histogram('fyyur_request_rows_hydrated', 'ORM instances loaded per request.',
+                               (0, 10, 100, 1000, 10000)),
+}
+
+
+def render_metrics():
+    """Every request histogram, in the Prometheus text format."""
+    return '\n'.join(histogram.render() for histogram in HISTOGRAMS.values()) + '\n'
+
+#----------------------------------------------------------------------------#
+# Middleware.
+#----------------------------------------------------------------------------#
+
+def init_app(app):
+    """Record statements, DB time, template time and rows hydrated per request.
+
+    Each request is added to the HISTOGRAMS under its endpoint. Requests slower
+    than SLOW_REQUEST_MS are logged as one JSON object, as are those over
+    ROWS_HYDRATED_WARNING rows; with ROWS_HYDRATED_HEADER set the counts are
+    also returned as X-Rows-Hydrated / X-Query-Count. In testing, MAX_QUERIES
+    ({endpoint: n}) turns a view going over its statement budget into an
+    AssertionError. Streamed responses are recorded once their body has been
+    sent (without the headers, which are gone by then), the AssertionError
+    raised from the end of the body.
+    """
+    app.config.setdefault('ROWS_HYDRATED_WARNING', 1000)
+    app.config.setdefault('ROWS_HYDRATED_HEADER', app.debug)
+    app.config.setdefault('SLOW_REQUEST_MS', 500)
+    app.config.setdefault('MAX_QUERIES', {})
+
+    if not event.contains(db.Model, 'load', _count_hydrated):
+        event.listen(db.Model, 'load', _count_hydrated, propagate=True)
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    app.jinja_env.template_class = TimedTemplate
+
+    @app.before_request
+    def start_timer():
+        # g outlives the request when an app context was already pushed
+        g.statements = g.rows_hydrated = 0
+        g.db_time = g.template_time = 0.0
+        g.request_start = time.perf_counter()
+
+    def record(state, start, details, response=None):
+        stats = request_stats(state)
+        duration = time.perf_counter() - start
+        endpoint = details['endpoint']
+        for name, value in dict(stats, duration=duration).items():
+            HISTOGRAMS[name].observe(endpoint, value)
+
+        if duration * 1000 > app.config['SLOW_REQUEST_MS'] \
+                or stats['rows_hydrated'] > app.config['ROWS_HYDRATED_WARNING']:
+            app.logger.warning('slow request %s', json.dumps(dict(
+                details,
+                duration_ms=round(duration * 1000, 2),
+                db_ms=round(stats['db_time'] * 1000, 2),
+                statements=stats['statements'],
+                template_ms=round(stats['template_time'] * 1000, 2),
+                rows_hydrated=stats['rows_hydrated'],
+            )))
+        if response is not None and app.config['ROWS_HYDRATED_HEADER']:
+            response.headers['X-Rows-Hydrated'] = str(stats['rows_hydrated'])
+            response.headers['X-Query-Count'] = str(stats['statements'])
+
+        budget = app.config['MAX_QUERIES'].get(endpoint)
+        if app.testing and budget is not None and stats['statements'] > budget:
+            raise AssertionError('%s ran %d queries, expected at most %d'
+                                 % (endpoint, stats['statements'], budget))
+
+    def record_stream(chunks, state, start, details):
+        try:
+            yield from chunks
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+            record(state, start, details)
+
+    @app.after_request
+    def record_request(response):
+        state = g._get_current_object()
+        start = g.get('request_start', time.perf_counter())
+        details = {
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint or 'unmatched',
+            'status': response.status_code,
+        }
+        if response.is_streamed:
+            # A streamed body is produced after this hook, and its queries
+            # and template time with it: record the request once it is sent.
+            response.response = record_stream(response.response, state, start, details)
+        else:
+            record(state, start, details, response)
+        return response
@@ -0,0 +1,269 @@
+import json
+import os
+import threading
+import time
+import traceback
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, event, func, or_, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from models import db, Job
+import instrumentation
+
+#----------------------------------------------------------------------------#
+# Tasks.
+#----------------------------------------------------------------------------#
+
+# Side work a request triggers but shouldn't wait for is queued as a row of
+# the Job table and run after the request's transaction commits, by worker
+# threads in each web process (JOB_WORKERS) or a separate `flask fyyur
+# work-jobs` process. No broker is needed: workers claim due jobs from the
+# table. A failed job is tried again JOB_RETRY_DELAY seconds later, then
+# twice as long each time, up to JOB_MAX_ATTEMPTS attempts in all. Tasks
+# must be safe to run twice, since a job whose worker died is picked up
+# again after JOB_TIMEOUT seconds.
+
+TASKS = {}
+
+
+def task(name):
+    """Register the decorated function as the task ``name``; a job runs it
+    as function(**arguments) in an app context."""
+    def decorator(function):
+        TASKS[name] = function
+        return function
+    return decorator
+
+
+def enqueue(name, delay=0, unique=False, **arguments):
+    """Queue the task ``name`` with the keyword ``arguments`` (JSON values);
+    returns the job id. The job is inserted on the session's transaction,
+    so it only runs if that commits; local workers are woken when it does.
+    With ``unique`` nothing is queued, and None returned, while the same
+    task and arguments are already queued."""
+    if name not in TASKS:
+        raise KeyError('unknown task %r' % name)
+    table = Job.__table__
+    encoded = json.dumps(arguments, sort_keys=True)
+    connection = db.session.connection()
+    if unique and connection.execute(select(table.c.id).where(
+            table.c.task == name, table.c.arguments == encoded, table.c.status == 'queued').limit(1)).first():
+        return None
+    now = datetime.utcnow()
+    statement = table.insert().values(
+        task=name, arguments=encoded, status='queued', attempts=0,
+        max_attempts=current_app.config['JOB_MAX_ATTEMPTS'],
+        run_at=now + timedelta(seconds=delay), created_at=now)
+    db.session.info['jobs_enqueued'] = True
+    if connection.dialect.implicit_returning:
+        return connection.execute(statement.returning(table.c.id)).scalar()
+    return connection.execute(statement).inserted_primary_key[0]
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_workers(session):
+    if session.info.pop('jobs_enqueued', False):
+        queue.wake()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_jobs(session):
+    session.info.pop('jobs_enqueued', None)
+
+#----------------------------------------------------------------------------#
+# Running jobs.
+#----------------------------------------------------------------------------#
+
+def claim(now):
+    """Mark the next due job running and return its row, or None if no job
+    is due. Due jobs are the queued ones whose run_at has passed and the
+    running ones started more than JOB_TIMEOUT seconds ago."""
+    table = Job.__table__
+    stalled = now - timedelta(seconds=current_app.config['JOB_TIMEOUT'])
+    due = or_(and_(table.c.status == 'queued', table.c.run_at <= now),
+              and_(table.c.status == 'running', table.c.started_at < stalled))
+    while True:
+        connection = db.session.connection()
+        row = connection.execute(
+            select(table).where(due).order_by(table.c.run_at, table.c.id).limit(1)
+            .with_for_update(skip_locked=True)
+        ).first()
+        if row is None:
+            db.session.rollback()
+            return None
+        # the status and attempts guard another worker claiming it meanwhile (SQLite has no row locks)
+        claimed = connection.execute(table.update().where(
+            table.c.id == row.id, table.c.status == row.status, table.c.attempts == row.attempts
+        ).values(status='running', attempts=row.attempts + 1, started_at=now)).rowcount
+        db.session.commit()
+        if claimed:
+            return row
+
+
+def run(job):
+    """Run a claimed job: delete it if it succeeds, otherwise queue it again
+    or, after its last attempt, mark it failed. Returns 'done', 'retried'
+    or 'failed'."""
+    table = Job.__table__
+    config = current_app.config
+    start = time.perf_counter()
+    try:
+        function = TASKS.get(job.task)
+        if function is None:
+            raise LookupError('unknown task %r' % job.task)
+        function(**json.loads(job.arguments))
+        db.session.commit()
+        outcome = 'done'
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception('job %d (%s) failed', job.id, job.task)
+        error = traceback.format_exc()
+        # job is the row as claimed, before this attempt was counted
+        outcome = 'retried' if job.attempts + 1 < job.max_attempts else 'failed'
+    METRICS.record(job.task, outcome, time.perf_counter() - start)
+
+    if outcome == 'done':
+        statement = table.delete().where(table.c.id == job.id)
+    elif outcome == 'retried':
+        delay = config['JOB_RETRY_DELAY'] * 2 ** job.attempts
+        statement = table.update().where(table.c.id == job.id).values(
+            status='queued', run_at=datetime.utcnow() + timedelta(seconds=delay), error=error)
+    else:
+        statement = table.update().where(table.c.id == job.id).values(
+            status='failed', error=error)
+    db.session.execute(statement)
+    db.session.commit()
+    return outcome
+
+
+def run_pending(limit=None):
+    """Run due jobs in this thread until none is left (or ``limit`` ran);
+    returns how many ran. For a worker process's --burst mode and tests."""
+    ran = 0
+    while limit is None or ran < limit:
+        job = claim(datetime.utcnow())
+        if job is None:
+            break
+        run(job)
+        ran += 1
+    return ran
+
+
+class JobQueue:
+    """Starts JOB_WORKERS daemon threads in each process, on its first
+    request (so a forking server starts them in every worker), each running
+    due jobs one at a time in an app context. Idle workers poll the table
+    every JOB_POLL_INTERVAL seconds, and are woken as soon as a job queued
+    in this process is committed. With JOB_WORKERS = 0 (the default outside
+    development) jobs wait for a `flask fyyur work-jobs` process."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._pid = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JOB_WORKERS', 0)
+        app.config.setdefault('JOB_POLL_INTERVAL', 1.0)
+        app.config.setdefault('JOB_MAX_ATTEMPTS', 3)
+        app.config.setdefault('JOB_RETRY_DELAY', 10)
+        app.config.setdefault('JOB_TIMEOUT', 3600)
+        self.app = app
+        app.extensions['jobs'] = self
+        if app.config['JOB_WORKERS']:
+            app.before_request(lambda: self.start(app.config['JOB_WORKERS']))
+
+    def start(self, workers):
+        with self._lock:
+            if self._pid != os.getpid():
+                for number in range(workers):
+                    threading.Thread(target=self.work, name='fyyur-jobs-%d' % number, daemon=True).start()
+                self._pid = os.getpid()
+
+    def wake(self):
+        self._wake.set()
+
+    def work(self):
+        """Run jobs until the process exits."""
+        while True:
+            with self.app.app_context():
+                try:
+                    busy = run_pending(limit=1) > 0
+                except SQLAlchemyError:
+                    db.session.rollback()
+                    self.app.logger.exception('job worker could not reach the database')
+                    busy = False
+                finally:
+                    db.session.remove()
+            if not busy:
+                self._wake.wait(self.app.config['JOB_POLL_INTERVAL'])
+                self._wake.clear()
+
+
+queue = JobQueue()
+
+#----------------------------------------------------------------------------#
+# Metrics.
+#----------------------------------------------------------------------------#
+
+class JobMetrics:
+    """Jobs run by this process, by task and outcome, and their run times."""
+
+    def __init__(self):
+        self.outcomes = Counter()
+        self.duration = instrumentation.Histogram(
+            'fyyur_job_duration_seconds', 'Job run time.', instrumentation.SECONDS, label='task')
+        self._lock = threading.Lock()
+
+    def record(self, task, outcome, seconds):
+        with self._lock:
+            self.outcomes[task, outcome] += 1
+        self.duration.observe(task, seconds)
+
+    def render(self):
+        with self._lock:
+            outcomes = sorted(self.outcomes.items())
+        lines = ['# HELP fyyur_jobs_processed_total Jobs run by this process, by outcome.',
+                 '# TYPE fyyur_jobs_processed_total counter']
+        lines += ['fyyur_jobs_processed_total{task="%s",outcome="%s"} %d' % (task, outcome, count)
+                  for (task, outcome), count in outcomes]
+        return '\n'.join(lines) + '\n' + self.duration.render()
+
+
+METRICS = JobMetrics()
+
+
+def depth():
+    """[(task, status, jobs, oldest run_at)] from the Job table."""
+    table = Job.__table__
+    return db.session.execute(
+        select(table.c.task, table.c.status, func.count(), func.min(table.c.run_at))
+        .group_by(table.c.task, table.c.status).order_by(table.c.task, table.c.status)
+    ).all()
+
+
+def render_metrics():
+    """Queue depth by task and status, the age of the longest waiting due
+    job, and this process' throughput, in the Prometheus text format."""
+    lines = ['# HELP fyyur_jobs Jobs in the table, by task and status.', '# TYPE fyyur_jobs gauge']
+    now = datetime.utcnow()
+    waiting = 0.0
+    try:
+        for task, status, count, oldest in depth():
+            lines.append('fyyur_jobs{task="%s",status="%s"} %d' % (task, status, count))
+            if status == 'queued' and oldest < now:
+                waiting = max(waiting, (now - oldest).total_seconds())
+    except SQLAlchemyError:
+        db.session.rollback()
+        current_app.logger.warning('job queue depth unavailable', exc_info=True)
+    lines += ['# HELP fyyur_jobs_wait_seconds How long the longest waiting due job has waited.',
+              '# TYPE fyyur_jobs_wait_seconds gauge',
+              'fyyur_jobs_wait_seconds %r' % round(waiting, 3)]
+    return '\n'.join(lines) + '\n' + METRICS.render() + '\n'
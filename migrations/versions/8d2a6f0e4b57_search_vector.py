@@ -0,0 +1,35 @@
+"""full-text search vector and indexes
+
+Revision ID: 8d2a6f0e4b57
+Revises: 5c9e4a7b2d31
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2a6f0e4b57'
+down_revision = '5c9e4a7b2d31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+    CREATE OR REPLACE FUNCTION fyyur_search_vector(name text, city text, genres text[])
+    RETURNS tsvector LANGUAGE sql IMMUTABLE AS $$
+      SELECT setweight(to_tsvector('simple', coalesce(name, '')), 'A')
+          || setweight(to_tsvector('simple', coalesce(city, '')), 'B')
+          || setweight(to_tsvector('simple', coalesce(array_to_string(genres, ' '), '')), 'C')
+    $$
+    """)
+    op.execute('CREATE INDEX "ix_Venue_search" ON "Venue" USING gin (fyyur_search_vector(name, city, genres))')
+    op.execute('CREATE INDEX "ix_Artist_search" ON "Artist" USING gin (fyyur_search_vector(name, city, genres))')
+
+
+def downgrade():
+    op.execute('DROP INDEX "ix_Artist_search"')
+    op.execute('DROP INDEX "ix_Venue_search"')
+    op.execute('DROP FUNCTION fyyur_search_vector(text, text, text[])')
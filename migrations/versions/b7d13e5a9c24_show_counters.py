@@ -0,0 +1,49 @@
+"""show counters on venues and artists
+
+Revision ID: b7d13e5a9c24
+Revises: a41e7b9c0f62
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d13e5a9c24'
+down_revision = 'a41e7b9c0f62'
+branch_labels = None
+depends_on = None
+
+TABLES = {'Venue': 'venue_id', 'Artist': 'artist_id'}
+
+
+def upgrade():
+    for table in TABLES:
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), nullable=False, server_default='0'))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), nullable=False, server_default='0'))
+    counters = op.create_table(
+        'ShowCounters',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('rolled_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    # Backfill, split at the current (local) time like Show.start_time
+    now = datetime.now()
+    for table, key in TABLES.items():
+        op.execute(sa.text(
+            'UPDATE "{0}" SET '
+            'upcoming_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{1} = "{0}".id AND start_time > :now), '
+            'past_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{1} = "{0}".id AND start_time <= :now)'
+            .format(table, key)).bindparams(now=now))
+    op.bulk_insert(counters, [{'id': 1, 'rolled_at': now}])
+
+
+def downgrade():
+    op.drop_table('ShowCounters')
+    for table in reversed(list(TABLES)):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,57 @@
+"""show end times and booking exclusion constraints
+
+Revision ID: c3e8f1a6d7b2
+Revises: b7d13e5a9c24
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e8f1a6d7b2'
+down_revision = 'b7d13e5a9c24'
+branch_labels = None
+depends_on = None
+
+# Same as models.BOOKING_EXCLUSION
+BOOKING_EXCLUSION = ('ALTER TABLE "Show" ADD CONSTRAINT "ex_Show_{0}_booking" EXCLUDE USING gist '
+                     '(int4range({0}, {0}, \'[]\') WITH =, tsrange(start_time, end_time) WITH &&)')
+COLUMNS = ['artist_id', 'venue_id']
+DEFAULT_SHOW_MINUTES = 120
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+
+    # Existing shows get the default length, cut short where the next show of
+    # the same artist or venue starts, so the backfill adds no overlaps.
+    # Shows already double-booked at the same start time end up empty (and
+    # reported below); empty ranges never conflict.
+    op.execute(
+        'UPDATE "Show" SET end_time = LEAST('
+        "  next.start_time + interval '%d minutes', next.next_for_artist, next.next_for_venue) "
+        'FROM (SELECT id, start_time, '
+        '        lead(start_time) OVER (PARTITION BY artist_id ORDER BY start_time, id) AS next_for_artist, '
+        '        lead(start_time) OVER (PARTITION BY venue_id ORDER BY start_time, id) AS next_for_venue '
+        '      FROM "Show") AS next '
+        'WHERE next.id = "Show".id' % DEFAULT_SHOW_MINUTES)
+    op.alter_column('Show', 'end_time', nullable=False)
+    op.create_check_constraint('ck_Show_end_time', 'Show', 'end_time >= start_time')
+    for column in COLUMNS:
+        op.execute(BOOKING_EXCLUSION.format(column))
+
+    clashes = op.get_bind().execute(sa.text('SELECT count(*) FROM "Show" WHERE end_time = start_time')).scalar()
+    if clashes:
+        logging.getLogger('alembic.runtime.migration').warning(
+            '%d shows were double-booked at the same start time and now have no length', clashes)
+
+
+def downgrade():
+    for column in reversed(COLUMNS):
+        op.drop_constraint('ex_Show_%s_booking' % column, 'Show')
+    op.drop_constraint('ck_Show_end_time', 'Show', type_='check')
+    op.drop_column('Show', 'end_time')
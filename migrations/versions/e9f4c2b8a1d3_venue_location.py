@@ -0,0 +1,53 @@
+"""venue coordinates and spatial index, for nearby venue search
+
+Revision ID: e9f4c2b8a1d3
+Revises: d5a0b2c7e4f8
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+from geo import geocode
+
+
+# revision identifiers, used by Alembic.
+revision = 'e9f4c2b8a1d3'
+down_revision = 'd5a0b2c7e4f8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS cube')
+    op.execute('CREATE EXTENSION IF NOT EXISTS earthdistance')
+    op.add_column('Venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('longitude', sa.Float(), nullable=True))
+
+    # Existing venues are geocoded from the bundled city table, one update
+    # per distinct city; the rest keep no coordinates until they are edited.
+    connection = op.get_bind()
+    cities = connection.execute(sa.text('SELECT DISTINCT city, state FROM "Venue"')).fetchall()
+    unknown = 0
+    for city, state in cities:
+        location = geocode(city, state)
+        if location is None:
+            unknown += 1
+            continue
+        connection.execute(
+            sa.text('UPDATE "Venue" SET latitude = :latitude, longitude = :longitude '
+                    'WHERE city = :city AND state = :state'),
+            {'latitude': location[0], 'longitude': location[1], 'city': city, 'state': state})
+    if unknown:
+        logging.getLogger('alembic.runtime.migration').warning(
+            '%d venue cities are not in the city table; their venues have no coordinates', unknown)
+
+    op.execute('CREATE INDEX "ix_Venue_earth" ON "Venue" USING gist (ll_to_earth(latitude, longitude))')
+
+
+def downgrade():
+    op.execute('DROP INDEX "ix_Venue_earth"')
+    op.drop_column('Venue', 'longitude')
+    op.drop_column('Venue', 'latitude')
@@ -0,0 +1,47 @@
+"""cascade show foreign keys and add the show archive, for set-based deletes
+
+Revision ID: f3b7d1e6a9c2
+Revises: e9f4c2b8a1d3
+Create Date: 2026-10-17 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b7d1e6a9c2'
+down_revision = 'e9f4c2b8a1d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the initial schema left the keys unnamed, so they carry Postgres' default names
+    op.drop_constraint('Show_artist_id_fkey', 'Show', type_='foreignkey')
+    op.drop_constraint('Show_venue_id_fkey', 'Show', type_='foreignkey')
+    op.create_foreign_key('Show_artist_id_fkey', 'Show', 'Artist', ['artist_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('Show_venue_id_fkey', 'Show', 'Venue', ['venue_id'], ['id'], ondelete='CASCADE')
+
+    op.create_table('ShowArchive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('end_time', sa.DateTime(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_ShowArchive_venue_id', 'ShowArchive', ['venue_id'])
+    op.create_index('ix_ShowArchive_artist_id', 'ShowArchive', ['artist_id'])
+
+
+def downgrade():
+    op.drop_index('ix_ShowArchive_artist_id', table_name='ShowArchive')
+    op.drop_index('ix_ShowArchive_venue_id', table_name='ShowArchive')
+    op.drop_table('ShowArchive')
+
+    op.drop_constraint('Show_venue_id_fkey', 'Show', type_='foreignkey')
+    op.drop_constraint('Show_artist_id_fkey', 'Show', type_='foreignkey')
+    op.create_foreign_key('Show_artist_id_fkey', 'Show', 'Artist', ['artist_id'], ['id'])
+    op.create_foreign_key('Show_venue_id_fkey', 'Show', 'Venue', ['venue_id'], ['id'])
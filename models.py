@@ -1,5 +1,90 @@
+import os
+from datetime import datetime, timedelta
 from flask_sqlalchemy import SQLAlchemy
-db = SQLAlchemy()
+from sqlalchemy import DDL, event
+
+from validation import DEFAULT_SHOW_MINUTES
+
+
+def engine_options(config, backend):
+    """create_engine() options for the DATABASE_* settings in config.py.
+
+    ``backend`` is the dialect name. SQLite keeps its default pool, since
+    its pools take none of these options.
+    """
+    options = {'query_cache_size': config.get('DATABASE_STATEMENT_CACHE_SIZE', 500)}
+    if backend != 'sqlite':
+        options.update(
+            pool_size=config.get('DATABASE_POOL_SIZE', 5),
+            max_overflow=config.get('DATABASE_MAX_OVERFLOW', 10),
+            pool_timeout=config.get('DATABASE_POOL_TIMEOUT', 30),
+            pool_recycle=config.get('DATABASE_POOL_RECYCLE', 1800),
+            pool_pre_ping=config.get('DATABASE_POOL_PRE_PING', True),
+        )
+    return options
+
+
+def statement_timeout_args(config, driver):
+    """connect_args setting Postgres' statement_timeout, or {} for none."""
+    timeout = config.get('DATABASE_STATEMENT_TIMEOUT')
+    if not timeout:
+        return {}
+    if driver == 'asyncpg':
+        return {'server_settings': {'statement_timeout': str(timeout)}}
+    return {'options': '-c statement_timeout=%d' % timeout}
+
+
+class Database(SQLAlchemy):
+    """SQLAlchemy with the DATABASE_* pool settings from config.py applied."""
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        # Flask-SQLAlchemy 2.5 returns (sa_url, options); 2.4 edits options in place
+        result = super().apply_driver_hacks(app, sa_url, options)
+        if result is not None:
+            sa_url, options = result
+        for name, value in engine_options(app.config, sa_url.get_backend_name()).items():
+            options.setdefault(name, value)
+        if sa_url.get_backend_name() == 'postgresql':
+            connect_args = options.setdefault('connect_args', {})
+            connect_args.update(statement_timeout_args(app.config, sa_url.get_driver_name()))
+        return sa_url, options
+
+db = Database()
+
+# The name search indexes use trigram operators.
+event.listen(db.Model.metadata, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
+# Venue distances use earthdistance (which needs cube); see geo.py.
+for extension in ('cube', 'earthdistance'):
+    event.listen(db.Model.metadata, 'before_create',
+                 DDL('CREATE EXTENSION IF NOT EXISTS %s' % extension).execute_if(dialect='postgresql'))
+
+# Weighted full-text document for search.py, declared IMMUTABLE so it can be
+# indexed. Kept in step with the search_vector migration.
+SEARCH_VECTOR_FUNCTION = '''
+CREATE OR REPLACE FUNCTION fyyur_search_vector(name text, city text, genres text[])
+RETURNS tsvector LANGUAGE sql IMMUTABLE AS $$
+  SELECT setweight(to_tsvector('simple', coalesce(name, '')), 'A')
+      || setweight(to_tsvector('simple', coalesce(city, '')), 'B')
+      || setweight(to_tsvector('simple', coalesce(array_to_string(genres, ' '), '')), 'C')
+$$
+'''
+event.listen(db.Model.metadata, 'before_create',
+             DDL(SEARCH_VECTOR_FUNCTION).execute_if(dialect='postgresql'))
+
+
+def search_index(table):
+    return DDL('CREATE INDEX "ix_{0}_search" ON "{0}" '
+               'USING gin (fyyur_search_vector(name, city, genres))'.format(table)).execute_if(dialect='postgresql')
+
+# Default loading strategy for Venue.shows / Artist.shows. The views query
+# shows directly (queries.py) and deletes are set-based (archive.py), so
+# touching the relationship raises instead of pulling every show ever booked.
+SHOWS_LAZY = os.environ.get('FYYUR_SHOWS_LAZY', 'raise')
+
+# Postgres ARRAY, stored as JSON on SQLite so benchmarks can run without a server.
+StringArray = db.ARRAY(db.String).with_variant(db.JSON, 'sqlite')
 
 #----------------------------------------------------------------------------#
 # Models.
@@ -7,6 +92,12 @@ db = SQLAlchemy()
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_state_city', 'state', 'city'),
+        db.Index('ix_Venue_name_trgm', 'name',
+                 postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Venue_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -18,18 +109,31 @@ class Venue(db.Model):
     image_link = db.Column(db.String(500))
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
-    genres = db.Column(db.ARRAY(db.String))
+    genres = db.Column(StringArray)
     website = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.String)
-    shows = db.relationship('Show', backref=db.backref("Venue"), lazy="joined")
+    # Geocoded from city/state (geo.py); None for cities it doesn't know
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    # Maintained by counters.py; see ShowCounters
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=datetime.utcnow, onupdate=datetime.utcnow)
+    shows = db.relationship('Show', backref=db.backref("Venue"), lazy=SHOWS_LAZY, passive_deletes=True)
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_name_trgm', 'name',
+                 postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Artist_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
-    genres = db.Column(db.ARRAY(db.String))
+    genres = db.Column(StringArray)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
@@ -40,14 +144,112 @@ class Artist(db.Model):
     website = db.Column(db.String)
     seeking_venue = db.Column(db.Boolean)
     seeking_description = db.Column(db.String)
-    shows = db.relationship('Show', backref=db.backref("Artist"), lazy="joined")
+    # Maintained by counters.py; see ShowCounters
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=datetime.utcnow, onupdate=datetime.utcnow)
+    shows = db.relationship('Show', backref=db.backref("Artist"), lazy=SHOWS_LAZY, passive_deletes=True)
+
+def default_end_time(context):
+    return context.get_current_parameters()['start_time'] + timedelta(minutes=DEFAULT_SHOW_MINUTES)
 
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 class Show(db.Model):
   __tablename__ = 'Show'
+  __table_args__ = (
+    db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+    db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+    db.CheckConstraint('end_time >= start_time', name='ck_Show_end_time'),
+  )
 
   id = db.Column(db.Integer, primary_key=True)
-  artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
-  venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+  # Deleting a venue or artist archives its shows first (archive.py); the
+  # cascade only catches deletes that skip it.
+  artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
+  venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
   start_time = db.Column(db.DateTime, nullable=False)
+  # Bookings cover [start_time, end_time); see bookings.py
+  end_time = db.Column(db.DateTime, nullable=False, default=default_end_time)
+  updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                         default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ShowArchive(db.Model):
+  """Shows of deleted venues and artists, moved here by archive.py. No
+  foreign keys: the venue or artist they were booked with may be gone."""
+  __tablename__ = 'ShowArchive'
+  __table_args__ = (
+    db.Index('ix_ShowArchive_venue_id', 'venue_id'),
+    db.Index('ix_ShowArchive_artist_id', 'artist_id'),
+  )
+
+  # the id the show had in Show
+  id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+  artist_id = db.Column(db.Integer, nullable=False)
+  venue_id = db.Column(db.Integer, nullable=False)
+  start_time = db.Column(db.DateTime, nullable=False)
+  end_time = db.Column(db.DateTime, nullable=False)
+  archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class ShowCounters(db.Model):
+  """Single row recording when upcoming_shows_count / past_shows_count were
+  last rolled forward: they split each entity's shows at ``rolled_at``, not
+  at the current time (see counters.py)."""
+  __tablename__ = 'ShowCounters'
+
+  id = db.Column(db.Integer, primary_key=True)
+  rolled_at = db.Column(db.DateTime, nullable=False)
+
+
+class Job(db.Model):
+  """Background work queued by jobs.py: the registered function ``task``
+  called with the JSON object ``arguments`` as keyword arguments. Jobs are
+  queued, then running, and deleted once they succeed; ``failed`` rows are
+  kept with their last error."""
+  __tablename__ = 'Job'
+  __table_args__ = (
+    db.Index('ix_Job_status_run_at', 'status', 'run_at'),
+  )
+
+  id = db.Column(db.Integer, primary_key=True)
+  task = db.Column(db.String(120), nullable=False)
+  arguments = db.Column(db.Text, nullable=False, default='{}')
+  status = db.Column(db.String(10), nullable=False, default='queued')
+  attempts = db.Column(db.Integer, nullable=False, default=0)
+  max_attempts = db.Column(db.Integer, nullable=False)
+  # not picked up before this; pushed back after each failed attempt
+  run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+  created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+  started_at = db.Column(db.DateTime)
+  error = db.Column(db.Text)
+
+
+@event.listens_for(ShowCounters.__table__, 'after_create')
+def _start_show_counters(target, connection, **kw):
+  connection.execute(target.insert().values(id=1, rolled_at=datetime.now()))
+
+
+# Postgres refuses overlapping bookings of an artist or a venue, whatever
+# wrote them; bookings.py checks first so users get a readable error. The id
+# is wrapped in a one-value int4range so GiST can compare it without the
+# btree_gist extension. Kept in step with the show_end_time migration.
+BOOKING_EXCLUSION = ('ALTER TABLE "Show" ADD CONSTRAINT "ex_Show_{0}_booking" EXCLUDE USING gist '
+                     '(int4range({0}, {0}, \'[]\') WITH =, tsrange(start_time, end_time) WITH &&)')
+
+
+def booking_exclusion(column):
+    return DDL(BOOKING_EXCLUSION.format(column)).execute_if(dialect='postgresql')
+
+event.listen(Show.__table__, 'after_create', booking_exclusion('artist_id'))
+event.listen(Show.__table__, 'after_create', booking_exclusion('venue_id'))
 
+event.listen(Venue.__table__, 'after_create', search_index('Venue'))
+# Spatial index for geo.py's radius and nearest-venue queries. Kept in step
+# with the venue_location migration.
+event.listen(Venue.__table__, 'after_create',
+             DDL('CREATE INDEX "ix_Venue_earth" ON "Venue" '
+                 'USING gist (ll_to_earth(latitude, longitude))').execute_if(dialect='postgresql'))
+event.listen(Artist.__table__, 'after_create', search_index('Artist'))
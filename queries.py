@@ -0,0 +1,204 @@
+import binascii
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from bisect import bisect_right
+from datetime import datetime
+from itertools import groupby
+
+from flask import current_app, g
+from sqlalchemy import select, tuple_
+
+from models import db, Venue, Artist, Show
+
+def request_now():
+    """The current time, captured once per request."""
+    if 'now' not in g:
+        g.now = datetime.now()
+    return g.now
+
+#----------------------------------------------------------------------------#
+# Venue directory.
+#----------------------------------------------------------------------------#
+
+def venue_directory(batch_size=None):
+    """Return the venues grouped by area, as expected by pages/venues.html:
+
+    [{"city": ..., "state": ..., "venues": [{"id", "name", "num_upcoming_shows"}]}]
+
+    Upcoming show counts are read from the counters maintained by counters.py,
+    so the page costs one query over Venue alone however many shows exist.
+
+    With ``batch_size`` the rows are read through a server-side cursor that
+    many at a time, and areas and their venues are generated lazily (see
+    iter_areas) for a streamed page.
+    """
+    rows = db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        Venue.upcoming_shows_count.label('num_upcoming_shows')
+    ).order_by(Venue.state, Venue.city, Venue.id)
+
+    if batch_size is not None:
+        return iter_areas(stream(rows, batch_size))
+    return group_by_area(rows)
+
+
+def group_by_area(rows):
+    """Group rows already ordered by (state, city) in a single pass."""
+    return [dict(area, venues=list(area['venues'])) for area in iter_areas(rows)]
+
+
+def iter_areas(rows):
+    """group_by_area() as a generator; each area's venues are an iterator
+    too, and must be consumed before moving on to the next area."""
+    for (state, city), venues in groupby(rows, key=lambda row: (row.state, row.city)):
+        yield {
+            "city": city,
+            "state": state,
+            "venues": ({
+                "id": venue.id,
+                "name": venue.name,
+                "num_upcoming_shows": venue.num_upcoming_shows
+            } for venue in venues)
+        }
+
+
+def stream(query, batch_size):
+    """Iterate ``query`` through a server-side cursor, ``batch_size`` rows at
+    a time, so only one batch is held in memory."""
+    return query.execution_options(stream_results=True).yield_per(batch_size)
+
+#----------------------------------------------------------------------------#
+# Entity pages.
+#----------------------------------------------------------------------------#
+
+def venue_shows_statement(venue_id):
+    """Shows at a venue with the artist columns pages/show_venue.html needs."""
+    return select(
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        Show.start_time
+    ).join(Artist, Artist.id == Show.artist_id) \
+        .where(Show.venue_id == venue_id) \
+        .order_by(Show.start_time, Show.id)
+
+
+def artist_shows_statement(artist_id):
+    """Shows by an artist with the venue columns pages/show_artist.html needs."""
+    return select(
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Venue.image_link.label('venue_image_link'),
+        Show.start_time
+    ).join(Venue, Venue.id == Show.venue_id) \
+        .where(Show.artist_id == artist_id) \
+        .order_by(Show.start_time, Show.id)
+
+
+def entity_statement(model, id):
+    """The row of one venue or artist, as a plain row rather than an instance."""
+    return select(model.__table__).where(model.id == id)
+
+
+def fetch_all(*statements):
+    """Rows of each statement, in order. With ASYNC_QUERIES on they run
+    concurrently (see aio.py), otherwise one after another on the session."""
+    aio = current_app.extensions.get('aio')
+    if aio is not None:
+        return aio.fetch_all(*statements)
+    return [db.session.execute(statement).all() for statement in statements]
+
+
+def partition_shows(rows, now=None):
+    """Split rows ordered by start_time into (past, upcoming) at ``now``.
+
+    A show is upcoming once start_time > now, as on /shows and in the show
+    counters. Both halves are plain slices of ``rows``. The bisect runs on
+    a list of the start times, since bisect's key argument needs Python 3.10.
+    """
+    if now is None:
+        now = request_now()
+    split = bisect_right([row.start_time for row in rows], now)
+    return rows[:split], rows[split:]
+
+
+#----------------------------------------------------------------------------#
+# Show listing.
+#----------------------------------------------------------------------------#
+
+# Columns of a show listing row, by name.
+SHOW_COLUMNS = {
+    'id': Show.id,
+    'venue_id': Show.venue_id,
+    'venue_name': Venue.name.label('venue_name'),
+    'artist_id': Show.artist_id,
+    'artist_name': Artist.name.label('artist_name'),
+    'artist_image_link': Artist.image_link.label('artist_image_link'),
+    'start_time': Show.start_time,
+}
+
+
+def upcoming_shows_page(after=None, limit=50, now=None, fields=None):
+    """One page of upcoming shows for pages/shows.html, ordered by
+    (start_time, id), plus the cursor of the next page (None on the last).
+
+    ``after`` is the cursor returned with the previous page. Paging on the
+    sort key keeps every page a single index range scan, however deep.
+    ``fields`` limits the selected columns to those SHOW_COLUMNS names
+    (id and start_time are always selected, for the cursor).
+    """
+    if now is None:
+        now = request_now()
+    if fields is None:
+        fields = SHOW_COLUMNS
+    names = ['id', 'start_time'] + [name for name in fields if name not in ('id', 'start_time')]
+    query = db.session.query(*[SHOW_COLUMNS[name] for name in names]) \
+        .select_from(Show) \
+        .join(Venue, Venue.id == Show.venue_id) \
+        .join(Artist, Artist.id == Show.artist_id) \
+        .filter(Show.start_time > now)
+    if after is not None:
+        query = query.filter(tuple_(Show.start_time, Show.id) > decode_cursor(after))
+    rows = query.order_by(Show.start_time, Show.id).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].start_time, rows[-1].id)
+    return rows, next_cursor
+
+
+def encode_cursor(start_time, id):
+    value = '%s|%d' % (start_time.isoformat(), id)
+    return urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return (start_time, id) from a cursor; raises ValueError if malformed."""
+    try:
+        start_time, id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(start_time), int(id)
+    except (TypeError, UnicodeError, binascii.Error) as e:
+        raise ValueError('invalid cursor %r' % cursor) from e
+
+
+#----------------------------------------------------------------------------#
+# Entity listing.
+#----------------------------------------------------------------------------#
+
+def entity_page(model, columns, after=None, limit=50):
+    """One page of ``model`` rows with only ``columns`` selected, ordered by
+    id, plus the id to pass as ``after`` for the next page (None on the last).
+    """
+    query = db.session.query(model.id, *[column for column in columns if column is not model.id])
+    if after is not None:
+        query = query.filter(model.id > after)
+    rows = query.order_by(model.id).limit(limit + 1).all()
+
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = rows[-1].id
+    return rows, next_after
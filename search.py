@@ -0,0 +1,125 @@
+import re
+from difflib import SequenceMatcher
+
+from flask import current_app
+from sqlalchemy import func, or_
+
+from models import db, Venue, Artist
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def search_venues(term, limit=None):
+    return search(Venue, term, limit)
+
+
+def search_artists(term, limit=None):
+    return search(Artist, term, limit)
+
+
+def search(model, term, limit=None):
+    """Rank ``model`` rows against ``term`` and return the results dict the
+    search templates expect: {"count": n, "data": [{"id", "name",
+    "num_upcoming_shows"}]}, best match first. Upcoming show counts come
+    from the counters maintained by counters.py.
+    """
+    if limit is None:
+        limit = current_app.config['SEARCH_LIMIT']
+    data = get_backend().search(model, (term or '').strip(), limit)
+    return {"count": len(data), "data": data}
+
+
+def get_backend():
+    name = current_app.config.get('SEARCH_BACKEND')
+    if name is None:
+        name = 'postgres' if db.engine.dialect.name == 'postgresql' else 'memory'
+    return BACKENDS[name]
+
+
+def like_pattern(term):
+    """ILIKE pattern matching ``term`` anywhere, with wildcards escaped."""
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return '%' + escaped + '%'
+
+
+class PostgresSearchBackend:
+    """Full-text search over name, city and genres, with a trigram fallback
+    for typos and partial words.
+
+    Uses the fyyur_search_vector() function and the indexes created by the
+    migrations (see models.py). The typo cut-off is pg_trgm's own
+    pg_trgm.similarity_threshold setting.
+    """
+
+    def search(self, model, term, limit):
+        vector = func.fyyur_search_vector(model.name, model.city, model.genres)
+        words = WORD.findall(term.lower())
+
+        matches = [model.name.ilike(like_pattern(term), escape='\\')]
+        order = [model.name, model.id]
+        if words:
+            query = func.to_tsquery('simple', ' & '.join(word + ':*' for word in words))
+            matches += [vector.op('@@')(query), model.name.op('%')(term)]
+            rank = func.ts_rank(vector, query) + func.similarity(model.name, term)
+            order.insert(0, rank.desc())
+
+        rows = db.session.query(
+            model.id,
+            model.name,
+            model.upcoming_shows_count.label('num_upcoming_shows')
+        ).filter(or_(*matches)) \
+            .order_by(*order) \
+            .limit(limit)
+
+        return [row._asdict() for row in rows]
+
+
+class InMemorySearchBackend:
+    """Search scored in Python, for SQLite and tests.
+
+    Matches the same things as the Postgres backend: the term anywhere in the
+    name, word prefixes of name, city and genres, and names close to the term.
+    """
+
+    similarity_threshold = 0.75
+
+    def search(self, model, term, limit):
+        needle = term.lower()
+        words = WORD.findall(needle)
+        scored = []
+        for row in db.session.query(model.id, model.name, model.city, model.genres, model.upcoming_shows_count):
+            score = self.score(row, needle, words)
+            if score > 0:
+                scored.append((-score, row.name or '', row.id, row.upcoming_shows_count))
+        scored.sort()
+
+        return [{
+            "id": id,
+            "name": name,
+            "num_upcoming_shows": num_upcoming_shows
+        } for _, name, id, num_upcoming_shows in scored[:limit]]
+
+    def score(self, row, needle, words):
+        name = (row.name or '').lower()
+        score = 0.0
+        if needle in name:
+            score += 1.0
+        if words:
+            tokens = WORD.findall(' '.join([name, row.city or ''] + list(row.genres or [])).lower())
+            if all(any(token.startswith(word) for token in tokens) for word in words):
+                score += 1.0
+            elif score == 0:
+                similarity = SequenceMatcher(None, name, needle).ratio()
+                if similarity >= self.similarity_threshold:
+                    score += similarity
+        return score
+
+
+BACKENDS = {
+    'postgres': PostgresSearchBackend(),
+    'memory': InMemorySearchBackend(),
+}
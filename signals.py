@@ -0,0 +1,48 @@
+#----------------------------------------------------------------------------#
+# Write signals.
+#----------------------------------------------------------------------------#
+
+# The write paths (writes.py, archive.py) announce what they saved here, and
+# other modules connect receivers to react, such as tasks.py queueing
+# background jobs. Signals are sent inside the writer's transaction, before
+# it commits: whatever a receiver writes through the session (jobs.enqueue()
+# does) commits or rolls back with the change, so receivers must be quick
+# and leave anything slow to a job.
+
+
+class Signal:
+    """A named list of receivers, called in order with the sender and the
+    signal's keyword arguments. A minimal stand-in for blinker's signals,
+    which Flask's own need and the app doesn't install."""
+
+    def __init__(self, name):
+        self.name = name
+        self.receivers = []
+
+    def __repr__(self):
+        return '<Signal %s>' % self.name
+
+    def connect(self, receiver):
+        """Add ``receiver``; returns it, so this works as a decorator."""
+        if receiver not in self.receivers:
+            self.receivers.append(receiver)
+        return receiver
+
+    def disconnect(self, receiver):
+        if receiver in self.receivers:
+            self.receivers.remove(receiver)
+
+    def send(self, sender, **kwargs):
+        """Call every receiver; returns [(receiver, result)]."""
+        return [(receiver, receiver(sender, **kwargs)) for receiver in list(self.receivers)]
+
+
+# sender: the model (Venue or Artist); id, created (True for an insert) and
+# changed ({column: value}, all the values for an insert)
+entity_saved = Signal('entity-saved')
+
+# sender: the model; id. Sent before the row is deleted.
+entity_deleted = Signal('entity-deleted')
+
+# sender: Show; shows, a list of dicts with artist_id, venue_id, start_time and end_time
+shows_booked = Signal('shows-booked')
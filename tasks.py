@@ -0,0 +1,116 @@
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from flask import current_app
+from sqlalchemy import select
+from werkzeug.exceptions import HTTPException
+
+from models import Venue, Artist
+from cache import cache
+from writes import UnitOfWork
+import geo
+import jobs
+import signals
+
+#----------------------------------------------------------------------------#
+# Tasks.
+#----------------------------------------------------------------------------#
+
+@jobs.task('warm_pages')
+def warm_pages(paths):
+    """Render ``paths`` into the page cache before a visitor asks for them.
+
+    Only queued with a shared (Redis) cache: an in-process cache would be
+    filled in whichever process ran the job. Each page is dispatched
+    straight to its view in a fresh app context, skipping the request hooks,
+    so these renders stay out of the request metrics and slow-request log.
+    """
+    app = current_app._get_current_object()
+    for path in paths:
+        with app.app_context(), app.test_request_context(path):
+            try:
+                app.dispatch_request()
+            except HTTPException:
+                pass  # deleted since the job was queued
+
+
+@jobs.task('geocode_venue')
+def geocode_venue(venue_id):
+    """Fill in the coordinates of a venue from its city and state."""
+    table = Venue.__table__
+    with UnitOfWork() as work:
+        place = work.connection.execute(
+            select(table.c.city, table.c.state).where(table.c.id == venue_id).with_for_update()
+        ).first()
+        if place is None:
+            return  # deleted since the job was queued
+        latitude, longitude = geo.geocode(place.city, place.state) or (None, None)
+        work.update(Venue, venue_id, {'latitude': latitude, 'longitude': longitude})
+        work.invalidate('venues')  # the in-process location index (geo.py)
+
+
+@jobs.task('check_links')
+def check_links(links):
+    """Request each of ``links`` ({field: url}) and log the ones that are
+    broken, or whose image_link isn't an image. A link that can't be
+    reached at all fails the job, so it is tried again later."""
+    for field, url in links.items():
+        try:
+            request = Request(url, method='HEAD', headers={'User-Agent': 'fyyur-link-check'})
+            with urlopen(request, timeout=current_app.config['LINK_CHECK_TIMEOUT']) as response:
+                kind = response.headers.get('Content-Type', '')
+        except HTTPError as e:
+            current_app.logger.warning('broken %s %s: HTTP %d', field, url, e.code)
+            continue
+        except ValueError:
+            current_app.logger.warning('broken %s %r: not a URL', field, url)
+            continue
+        except (URLError, OSError) as e:
+            raise URLError('%s %s unreachable: %s' % (field, url, getattr(e, 'reason', e)))
+        if field == 'image_link' and not kind.startswith('image/'):
+            current_app.logger.warning('%s %s is not an image (%s)', field, url, kind or 'no type')
+
+#----------------------------------------------------------------------------#
+# Signal receivers.
+#----------------------------------------------------------------------------#
+
+# Columns holding links to check after a write
+LINKS = ('image_link', 'facebook_link', 'website')
+
+# Pages of each model to warm after a write
+PAGES = {
+    Venue: ['/venues', '/venues/%d'],
+    Artist: ['/artists', '/artists/%d'],
+}
+
+
+def pages(model, id):
+    return [path % id if '%d' in path else path for path in PAGES[model]]
+
+
+def warm(paths):
+    if cache.shared:
+        jobs.enqueue('warm_pages', unique=True, paths=sorted(set(paths)))
+
+
+@signals.entity_saved.connect
+def entity_saved(model, id, created, changed):
+    if model is Venue and ('city' in changed or 'state' in changed):
+        jobs.enqueue('geocode_venue', venue_id=id)
+    links = {field: changed[field] for field in LINKS if changed.get(field)}
+    if links and current_app.config['LINK_CHECKS']:
+        jobs.enqueue('check_links', links=links)
+    warm(pages(model, id))
+
+
+@signals.entity_deleted.connect
+def entity_deleted(model, id):
+    warm([PAGES[model][0]])
+
+
+@signals.shows_booked.connect
+def shows_booked(sender, shows):
+    paths = ['/shows', '/venues']
+    for show in shows:
+        paths += ['/venues/%d' % show['venue_id'], '/artists/%d' % show['artist_id']]
+    warm(paths)
@@ -0,0 +1,243 @@
+import re
+from datetime import datetime
+
+from wtforms.validators import URL
+
+#----------------------------------------------------------------------------#
+# Choices.
+#----------------------------------------------------------------------------#
+
+state_choices = [
+    ('AL', 'AL'),
+    ('AK', 'AK'),
+    ('AZ', 'AZ'),
+    ('AR', 'AR'),
+    ('CA', 'CA'),
+    ('CO', 'CO'),
+    ('CT', 'CT'),
+    ('DE', 'DE'),
+    ('DC', 'DC'),
+    ('FL', 'FL'),
+    ('GA', 'GA'),
+    ('HI', 'HI'),
+    ('ID', 'ID'),
+    ('IL', 'IL'),
+    ('IN', 'IN'),
+    ('IA', 'IA'),
+    ('KS', 'KS'),
+    ('KY', 'KY'),
+    ('LA', 'LA'),
+    ('ME', 'ME'),
+    ('MT', 'MT'),
+    ('NE', 'NE'),
+    ('NV', 'NV'),
+    ('NH', 'NH'),
+    ('NJ', 'NJ'),
+    ('NM', 'NM'),
+    ('NY', 'NY'),
+    ('NC', 'NC'),
+    ('ND', 'ND'),
+    ('OH', 'OH'),
+    ('OK', 'OK'),
+    ('OR', 'OR'),
+    ('MD', 'MD'),
+    ('MA', 'MA'),
+    ('MI', 'MI'),
+    ('MN', 'MN'),
+    ('MS', 'MS'),
+    ('MO', 'MO'),
+    ('PA', 'PA'),
+    ('RI', 'RI'),
+    ('SC', 'SC'),
+    ('SD', 'SD'),
+    ('TN', 'TN'),
+    ('TX', 'TX'),
+    ('UT', 'UT'),
+    ('VT', 'VT'),
+    ('VA', 'VA'),
+    ('WA', 'WA'),
+    ('WV', 'WV'),
+    ('WI', 'WI'),
+    ('WY', 'WY')
+]
+
+genre_choices = [
+    ('Alternative', 'Alternative'),
+    ('Blues', 'Blues'),
+    ('Classical', 'Classical'),
+    ('Country', 'Country'),
+    ('Electronic', 'Electronic'),
+    ('Folk', 'Folk'),
+    ('Funk', 'Funk'),
+    ('Hip-Hop', 'Hip-Hop'),
+    ('Heavy Metal', 'Heavy Metal'),
+    ('Instrumental', 'Instrumental'),
+    ('Jazz', 'Jazz'),
+    ('Musical Theatre', 'Musical Theatre'),
+    ('Pop', 'Pop'),
+    ('Punk', 'Punk'),
+    ('R&B', 'R&B'),
+    ('Reggae', 'Reggae'),
+    ('Rock n Roll', 'Rock n Roll'),
+    ('Soul', 'Soul'),
+    ('Other', 'Other'),
+]
+
+#----------------------------------------------------------------------------#
+# Checks.
+#----------------------------------------------------------------------------#
+
+# Each check takes a value and returns an error message, or None if it passes.
+# They are shared by the web forms, bulk imports and anything else accepting
+# venues, artists and shows, so patterns and tables are built once here.
+
+# Validate phone numbers like:
+# 1234567890 - no space
+# 123.456.7890 - dot separator
+# 123-456-7890 - dash separator
+# 123 456 7890 - space separator
+PHONE = re.compile(r'^\(?([0-9]{3})\)?[-. ]?([0-9]{3})[-. ]?([0-9]{4})$')
+
+# Show lengths in minutes: the default for bookings that don't give one, and
+# the longest allowed (bookings.py relies on it to bound overlap lookups)
+DEFAULT_SHOW_MINUTES = 120
+MAX_SHOW_MINUTES = 24 * 60
+
+STATES = frozenset(value for value, _ in state_choices)
+GENRES = frozenset(value for value, _ in genre_choices)
+URL_VALIDATOR = URL()
+
+
+def required(value):
+    if not value:
+        return 'This field is required.'
+
+
+def phone(value):
+    if PHONE.match(value) is None:
+        return 'Invalid phone.'
+
+
+def state(value):
+    if value not in STATES:
+        return 'Invalid state.'
+
+
+def genres(value):
+    if not GENRES.issuperset(value):
+        return 'Invalid genres.'
+
+
+def url(value):
+    # blank is fine: the link columns are nullable (put required first where one is needed)
+    if not value:
+        return None
+    match = URL_VALIDATOR.regex.match(value)
+    if match is None or not URL_VALIDATOR.validate_hostname(match.group('host')):
+        return 'Invalid URL.'
+
+
+def integer(value):
+    if not isinstance(value, int):
+        return 'Not a valid integer value'
+
+
+def datetime_value(value):
+    if not isinstance(value, datetime):
+        return 'Not a valid datetime value'
+
+
+def latitude(value):
+    if value is not None and not (isinstance(value, float) and -90 <= value <= 90):
+        return 'Not a valid latitude'
+
+
+def longitude(value):
+    if value is not None and not (isinstance(value, float) and -180 <= value <= 180):
+        return 'Not a valid longitude'
+
+#----------------------------------------------------------------------------#
+# Rules.
+#----------------------------------------------------------------------------#
+
+# field -> checks, run in order until one fails
+VENUE_RULES = {
+    'name': (required,),
+    'city': (required,),
+    'state': (required, state),
+    'address': (required,),
+    'phone': (required, phone),
+    'genres': (required, genres),
+    'facebook_link': (url,),
+    'latitude': (latitude,),
+    'longitude': (longitude,),
+}
+
+ARTIST_RULES = {
+    'name': (required,),
+    'city': (required,),
+    'state': (required, state),
+    'phone': (required, phone),
+    'genres': (required, genres),
+    'facebook_link': (url,),
+}
+
+SHOW_RULES = {
+    'artist_id': (integer,),
+    'venue_id': (integer,),
+    'start_time': (datetime_value,),
+    'end_time': (datetime_value,),
+}
+
+# The checks VenueForm / ArtistForm add on top of their WTForms validators
+ENTITY_FORM_RULES = {
+    'phone': (phone,),
+    'genres': (genres,),
+    'state': (state,),
+}
+
+#----------------------------------------------------------------------------#
+# Validation.
+#----------------------------------------------------------------------------#
+
+def validate(record, rules):
+    """Check one record (a dict) and return {field: [message]} for every
+    field that fails; empty if the record is valid."""
+    errors = {}
+    for field, checks in rules.items():
+        value = record.get(field)
+        for check in checks:
+            message = check(value)
+            if message is not None:
+                errors[field] = [message]
+                break
+    return errors
+
+
+def validate_batch(records, rules):
+    """Check a list of records in one pass; returns [(index, errors)] for the
+    invalid ones."""
+    invalid = []
+    for index, record in enumerate(records):
+        errors = validate(record, rules)
+        if errors:
+            invalid.append((index, errors))
+    return invalid
+
+
+def validate_columns(columns, rules):
+    """Check records given column-wise ({field: [values]}, all the same
+    length), one column at a time; returns {index: errors} for the invalid
+    records."""
+    invalid = {}
+    for field, checks in rules.items():
+        values = columns.get(field)
+        if values is None:
+            values = [None] * len(next(iter(columns.values()), []))
+        for index, value in enumerate(values):
+            for check in checks:
+                message = check(value)
+                if message is not None:
+                    invalid.setdefault(index, {})[field] = [message]
+                    break
+    return invalid
@@ -0,0 +1,198 @@
+from sqlalchemy import select
+
+from models import db, Venue, Artist, Show
+from cache import cache
+import bookings
+import counters
+import signals
+
+#----------------------------------------------------------------------------#
+# Unit of work.
+#----------------------------------------------------------------------------#
+
+# The form submissions write through here in Core rather than through ORM
+# objects: every submission is one transaction with a single commit, inserts
+# take their ids from INSERT ... RETURNING (the cursor's lastrowid on SQLite)
+# instead of reloading the object after the commit, and edits UPDATE only the
+# columns whose values changed. Each write sends its signal (signals.py) within
+# the transaction, which is how the background jobs that follow it get queued.
+
+# Form fields stored in a column of another name
+FORM_COLUMNS = {'website_link': 'website'}
+
+
+class WriteError(Exception):
+    """A submission refused because of its data, with nothing saved.
+    ``errors`` is {field: [message]}; show rows of a batch are named like
+    the WTForms FieldList entries they came from (shows-0-artist_id)."""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def form_values(model, data):
+    """{column: value} for ``model`` from form data (form.data), skipping
+    fields that aren't columns."""
+    columns = model.__table__.c
+    values = {}
+    for field, value in data.items():
+        name = FORM_COLUMNS.get(field, field)
+        if name in columns and name != 'id':
+            values[name] = value
+    return values
+
+
+def same(stored, submitted):
+    # forms submit '' for an empty text field the database may hold as NULL
+    return stored == submitted or (stored in (None, '') and submitted in (None, ''))
+
+
+class UnitOfWork:
+    """The writes of one submission, on the session's transaction.
+
+        with UnitOfWork() as work:
+            venue_id = work.insert(Venue, values)
+            ...
+
+    Commits once when the block ends and rolls back if it raises. Cache
+    tags passed to invalidate() are only invalidated after the commit, so
+    no reader can cache the old data again in between.
+    """
+
+    def __init__(self):
+        self.connection = None
+        self.tags = set()
+
+    def __enter__(self):
+        self.connection = db.session.connection()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is not None:
+            db.session.rollback()
+            return False
+        db.session.commit()
+        if self.tags:
+            cache.invalidate(*sorted(self.tags))
+        return False
+
+    def invalidate(self, *tags):
+        self.tags.update(tags)
+
+    def insert(self, model, values):
+        """INSERT one row; returns its id."""
+        table = model.__table__
+        statement = table.insert().values(**values)
+        if self.connection.dialect.implicit_returning:
+            return self.connection.execute(statement.returning(table.c.id)).scalar()
+        return self.connection.execute(statement).inserted_primary_key[0]
+
+    def changes(self, model, id, values):
+        """The {column: value} items of ``values`` that differ from row
+        ``id``, or None if there is no such row. Reads only those columns,
+        and locks the row (on Postgres) until the transaction ends so the
+        comparison still holds when the UPDATE runs."""
+        table = model.__table__
+        stored = self.connection.execute(
+            select(*[table.c[name] for name in values]).where(table.c.id == id).with_for_update()
+        ).first()
+        if stored is None:
+            return None
+        return {name: value for name, value in values.items() if not same(stored._mapping[name], value)}
+
+    def update(self, model, id, values):
+        """UPDATE row ``id`` with ``values`` only; nothing when it's empty."""
+        if values:
+            table = model.__table__
+            self.connection.execute(table.update().where(table.c.id == id).values(**values))
+
+    def book(self, shows, names=None, fields=None):
+        """Insert ``shows`` (dicts with artist_id, venue_id, start_time and
+        end_time) with one executemany, after bookings.booking_errors()
+        accepts all of them. Otherwise raises WriteError, with the fields
+        renamed by ``fields`` (to the form fields they came from) and
+        prefixed by the show's name in ``names`` if given."""
+        refused = bookings.booking_errors(shows, lock=True)
+        if refused:
+            fields = fields or {}
+            errors = {}
+            for index, row_errors in refused:
+                for field, messages in row_errors.items():
+                    field = fields.get(field, field)
+                    errors[field if names is None else '%s-%s' % (names[index], field)] = messages
+            raise WriteError(errors)
+        if not shows:
+            return
+        self.connection.execute(Show.__table__.insert(), shows)
+        # Core inserts skip the ORM events that keep the counters in step
+        counters.adjust(self.connection, [(show['venue_id'], show['artist_id'], show['start_time'])
+                                          for show in shows])
+        for show in shows:
+            self.invalidate(*cache.show_tags(show['venue_id'], show['artist_id']))
+        signals.shows_booked.send(Show, shows=shows)
+
+#----------------------------------------------------------------------------#
+# Submissions.
+#----------------------------------------------------------------------------#
+
+def create_venue(values, shows=None):
+    """Insert a venue and its first shows in one transaction; returns the
+    venue id. ``shows`` maps a name for each show, such as the form entry
+    it came from (shows-0), to a dict with artist_id, start_time and
+    end_time. If any show can't be booked, WriteError is raised and nothing
+    is saved. Its coordinates are filled in by a job (tasks.py)."""
+    shows = shows or {}
+    with UnitOfWork() as work:
+        venue_id = work.insert(Venue, values)
+        # the shows can only clash at the new venue with each other, over their times
+        work.book([dict(show, venue_id=venue_id) for show in shows.values()], names=list(shows),
+                  fields={'venue_id': 'start_time', 'end_time': 'duration'})
+        work.invalidate(*cache.venue_tags(venue_id, created=True))
+        signals.entity_saved.send(Venue, id=venue_id, created=True, changed=values)
+    return venue_id
+
+
+def update_venue(venue_id, values):
+    """Save the changed ``values`` of a venue; if it moved city, its
+    coordinates are cleared until a job geocodes it again (tasks.py).
+    Returns {column: value} of what changed, or None if there is no such
+    venue."""
+    with UnitOfWork() as work:
+        changed = work.changes(Venue, venue_id, values)
+        if changed and ('city' in changed or 'state' in changed):
+            changed = dict(changed, city=values['city'], state=values['state'], latitude=None, longitude=None)
+        if changed:
+            work.update(Venue, venue_id, changed)
+            work.invalidate(*cache.venue_tags(venue_id))
+            signals.entity_saved.send(Venue, id=venue_id, created=False, changed=changed)
+    return changed
+
+
+def create_artist(values):
+    """Insert an artist; returns its id."""
+    with UnitOfWork() as work:
+        artist_id = work.insert(Artist, values)
+        work.invalidate(*cache.artist_tags(artist_id, created=True))
+        signals.entity_saved.send(Artist, id=artist_id, created=True, changed=values)
+    return artist_id
+
+
+def update_artist(artist_id, values):
+    """Save the changed ``values`` of an artist. Returns {column: value} of
+    what changed, or None if there is no such artist."""
+    with UnitOfWork() as work:
+        changed = work.changes(Artist, artist_id, values)
+        if changed:
+            work.update(Artist, artist_id, changed)
+            work.invalidate(*cache.artist_tags(artist_id))
+            signals.entity_saved.send(Artist, id=artist_id, created=False, changed=changed)
+    return changed
+
+
+def create_show(show):
+    """Book one show (a dict with artist_id, venue_id, start_time and
+    end_time); raises WriteError if it can't be booked. A length error is
+    reported on the form's duration field."""
+    with UnitOfWork() as work:
+        work.book([show], fields={'end_time': 'duration'})